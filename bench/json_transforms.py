@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.ts import Ts  # noqa: E402
+
+
+def payload(size, seed=0):
+    rnd = random.Random(seed)
+    return {
+        'id': 'row-{}'.format(seed),
+        'verified': rnd.random() < 0.5,
+        'tags': ['tag{}'.format(rnd.randrange(100)) for _ in range(size // 10 + 1)],
+        'items': [
+            {'n': i, 'score': rnd.random(), 'name': 'item{}'.format(i), 'missing': None}
+            for i in range(size)
+        ],
+    }
+
+
+def bench(name, T, val, number):
+    encoded = T(val)
+    dumps = timeit.timeit(lambda: T(val), number=number) / number
+    loads = timeit.timeit(lambda: T(encoded, True), number=number) / number
+    print('{:<16} {:>10} {:>12.2f} {:>12.2f}'.format(
+        name, len(encoded), dumps * 1e6, loads * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the JSON column transforms.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    transforms = [
+        ('json', Ts.json),
+        ('fastJSON', Ts.fastJSON),
+        ('jsonListT', Ts.listTCreator(Ts.json)),
+        ('fastListT', Ts.fastListTCreator(Ts.fastJSON)),
+    ]
+    for size in args.sizes:
+        val = payload(size)
+        vals = [payload(size, seed) for seed in range(4)]
+        print('payload with {} items'.format(size))
+        print('{:<16} {:>10} {:>12} {:>12}'.format(
+            'transform', 'bytes', 'dumps us', 'loads us'))
+        for name, T in transforms:
+            bench(name, T, vals if name.endswith('ListT') else val,
+                  max(1, args.number // max(1, size // 10)))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,64 @@
 from .ts import Ts
+from .rowmodes import RowModes
+from array import array
+import itertools
 import re
 from uuid import uuid4
 from xxhash import xxh64
-import ramda as R
 import logging
 log0 = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+except Exception as e:
+    np = 'Error: numpy: ' + str(e)
+
 
 class DBError(Exception):
     pass
 
 
+class Fetcher:
+
+    defBatchSize = 2000
+
+    def __init__(self, names=(), fetchOne=None, fetchAll=None, fetchMany=None, close=None):
+        self.names = tuple(names)
+        self._fetchOne = fetchOne
+        self._fetchAll = fetchAll
+        self._fetchMany = fetchMany
+        self._close = close
+
+    def __call__(self):
+        return None if self._fetchOne is None else self._fetchOne()
+
+    def fetchMany(self, size=None):
+        if self._fetchMany is not None:
+            return self._fetchMany(size)
+        size = self.defBatchSize if size is None else size
+        rows = []
+        while len(rows) < size:
+            row = self()
+            if not row:
+                break
+            rows.append(row)
+        return rows
+
+    def fetchAll(self):
+        if self._fetchAll is not None:
+            return self._fetchAll()
+        rows = []
+        while True:
+            row = self()
+            if not row:
+                return rows
+            rows.append(row)
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+
 class DB:
 
     @staticmethod
@@ -40,6 +88,7 @@ class DB:
         self.util = util
         self._log = log
         self.savepoints = []
+        self._catalog = {}
 
     @classmethod
     def _makeArgs(cls, args, kwargs):
@@ -96,12 +145,49 @@ class DB:
         id = self.savepoints.pop()
         self.query(('ROLLBACK TO "{}"'.format(id)), debug=None)
         self.query(('RELEASE "{}"'.format(id)), debug=None)
+        # Rolled back DDL may have changed the catalog.
+        self.invalidateCatalog()
 
     def commit(self):
         self.log.debug('commit (%s)' % len(self.savepoints))
         id = self.savepoints.pop()
         self.query(('RELEASE "{}"'.format(id)), debug=None)
 
+    def invalidateCatalog(self, tables=None):
+        if tables is None:
+            self._catalog.clear()
+            return
+        for table in tables:
+            self._catalog.pop(table, None)
+
+    def catalogQuery(self, tables):
+        raise DBError('Not implemented.')
+
+    def catalogMissing(self, tables):
+        return [table for table in dict.fromkeys(tables) if table not in self._catalog]
+
+    def catalogUpdate(self, tables, rows):
+        found = {}
+        for row in rows:
+            found.setdefault((row['schema'], row['table']), set()).add(row['column'])
+        for table in tables:
+            sch, tbl = self.util.schemaTableSplit(table)
+            if (sch, tbl) in found:
+                # Already resolved by the catalog query.
+                self._catalog[table] = frozenset(found[(sch, tbl)])
+                continue
+            matches = [
+                columns for (schema, name), columns in found.items() if name == tbl and (sch is None or schema == sch)
+            ]
+            # Unqualified table names must be unambiguous.
+            self._catalog[table] = frozenset(matches[0]) if len(matches) == 1 else frozenset()
+
+    def catalogColumns(self, tables):
+        missing = self.catalogMissing(tables)
+        if len(missing) > 0:
+            self.catalogUpdate(missing, self.query(self.catalogQuery(missing)))
+        return {table: self._catalog[table] for table in tables}
+
     def queryColumns(self, *args, schemaRE=None, tableRE=None, columnRE=None,
                      pathRE=None, **kwargs):
         columnsQuery = self.columnQuery(schemaRE=schemaRE, tableRE=tableRE, columnRE=columnRE,
@@ -123,29 +209,133 @@ class DB:
                                      pathRE=pathRE, definitionRE=definitionRE)
         return self.query(indexQuery, *args, **kwargs)
 
-    def _queryHelper(self, qpT, transformer=None, stripParams=False, debug=None):
+    def _queryHelper(self, qpT, transformer=None, stripParams=False, debug=None, stream=False):
         raise DBError('Not implemented.')
 
-    def query(self, qpT, transformer=None, stripParams=False, fetchAll=False, debug=None):
-        q, p, T = self.util.qpTSplit(qpT)
+    @staticmethod
+    def createRowsT(names, T=None, transformer=None, rowMode=None):
+        # Resolves the transforms once per result description, the returned
+        # function then transforms whole batches of rows.
         if isinstance(T, dict) and not callable(T):
             T = Ts.RowTransformer(T)
-        pipes = []
-        if callable(T):
-            pipes.append(
-                lambda row: T(row, inverse=True)
-            )
-        if callable(transformer):
-            pipes.append(transformer)
-        _T = R.pipe(*pipes) if len(pipes) > 0 else lambda r: r
-
-        fetchOne = self._queryHelper((q, p), None, stripParams, debug)
-
-        gen = self.generateRow(fetchOne, _T)
+        rowMode = getattr(T, 'rowMode', None) if rowMode is None else rowMode
+        rowMode = RowModes.DICT if rowMode is None else rowMode
+        names = tuple(names)
+
+        Tis = []
+        rowTransform = None
+        if isinstance(T, Ts.RowTransformer) and type(T).__call__ is Ts.RowTransformer.__call__:
+            Tis = T.columnTransforms(names)
+            if T.hasRowTransform:
+                rowTransform = T.rowTransform
+        elif callable(T):
+            # also subclasses of RowTransformer with their own __call__
+            def rowTransform(row, inverse):
+                return T(row, inverse=inverse)
+
+        if rowMode == RowModes.LAZY and rowTransform is None:
+            # Lazy rows run each column transform on first access instead.
+            transforms = [None] * len(names)
+            for i, f in Tis:
+                transforms[i] = f
+            Tis = []
+            factory = RowModes.factory(RowModes.LAZY, names, transforms)
+        else:
+            # Row transforms work on dicts, so other modes are built from the result.
+            factory = RowModes.factory(
+                RowModes.DICT if rowTransform is not None else rowMode, names)
+
+        def transformRows(rows):
+            if len(Tis) > 0 and len(rows) > 0:
+                columns = list(zip(*rows))
+                for i, f in Tis:
+                    columns[i] = map(f, columns[i], itertools.repeat(True))
+                rows = zip(*columns)
+            res = list(map(factory, rows))
+            if rowTransform is not None:
+                res = [rowTransform(row, True) for row in res]
+                if rowMode != RowModes.DICT:
+                    res = [RowModes.fromDict(rowMode, row) for row in res]
+            if callable(transformer):
+                res = list(map(transformer, res))
+            return res
+
+        return transformRows
+
+    @classmethod
+    def createRowT(cls, names, T=None, transformer=None, rowMode=None):
+        rowsT = cls.createRowsT(names, T, transformer, rowMode)
+        return lambda row: rowsT((row,))[0]
+
+    def query(self, qpT, transformer=None, stripParams=False, fetchAll=False, debug=None, rowMode=None,
+              stream=False):
+        q, p, T = self.util.qpTSplit(qpT)
+
+        fetchOne = self._queryHelper(
+            (q, p), None, stripParams, debug=debug, stream=stream)
+
+        rowsT = self.createRowsT(fetchOne.names, T, transformer, rowMode)
         if fetchAll:
-            return [r for r in gen]
+            return rowsT(fetchOne.fetchAll())
+
+        return self.generateRows(fetchOne, rowsT)
+
+    def queryColumnar(self, qpT, stripParams=False, numpy=False, debug=None):
+        q, p, T = self.util.qpTSplit(qpT)
+
+        fetcher = self._queryHelper((q, p), None, stripParams, debug=debug)
+
+        return self.columnar(fetcher.names, fetcher.fetchAll(), T, numpy=numpy)
 
-        return gen
+    @classmethod
+    def columnar(cls, names, rows, T=None, numpy=False):
+        if isinstance(T, dict) and not callable(T):
+            T = Ts.RowTransformer(T)
+
+        if (callable(T) and not isinstance(T, Ts.RowTransformer)) \
+                or getattr(T, 'hasRowTransform', False):
+            # Row transforms may add or drop columns, so they run per row.
+            rows = cls.createRowsT(names, T)(rows)
+            names = rows[0].keys() if len(rows) > 0 else names
+            columns = {
+                name: [row.get(name) for row in rows] for name in names
+            }
+        else:
+            columns = dict(zip(names, map(list, zip(*rows)))) \
+                if len(rows) > 0 else {name: [] for name in names}
+            for name, values in columns.items():
+                if T and name in T:
+                    f = T[name]
+                    columns[name] = [f(value, True) for value in values]
+
+        return {
+            name: cls.compactColumn(values, numpy=numpy) for name, values in columns.items()
+        }
+
+    @staticmethod
+    def columnTypeCode(values):
+        if len(values) < 1:
+            return None
+        types = set(map(type, values))
+        if types == {int}:
+            return 'q' if -2**63 <= min(values) and max(values) < 2**63 else None
+        if types == {float} or types == {int, float}:
+            return 'd'
+        return None
+
+    @classmethod
+    def compactColumn(cls, values, numpy=False):
+        typeCode = cls.columnTypeCode(values)
+        if numpy:
+            if isinstance(np, str):
+                raise DBError(np)
+            if typeCode is None:
+                return np.array(values, dtype=object)
+            return np.array(values, dtype=np.int64 if typeCode == 'q' else np.float64)
+
+        if typeCode is None:
+            return values
+        return array(typeCode, values)
 
     @classmethod
     def constantRows(cls, colTypeMap: dict, rows: tuple | list):
@@ -185,3 +375,23 @@ class DB:
                 yield T(row)
             else:
                 break
+
+    @staticmethod
+    def generateRows(fetcher, rowsT, batchSize=None):
+        # The batches start small and grow, so the first row does not wait for a full batch.
+        maxSize = fetcher.defBatchSize if batchSize is None else batchSize
+        size = 1
+        try:
+            while True:
+                rows = fetcher.fetchMany(size)
+                if len(rows) < 1:
+                    break
+                for row in rowsT(rows):
+                    yield row
+                if size is not None:
+                    size *= 2
+                    if size >= maxSize:
+                        size = batchSize
+        finally:
+            # also runs when the caller stops early
+            fetcher.close()
@@ -1,6 +1,7 @@
 import itertools
 import ramda as R
 
+from .ormqueries import ORMError
 from .ormqueries import ORMQueries
 from .ormqueries import TableSpecModel
 
@@ -20,14 +21,27 @@ class ORM(ORMQueries):
     def createTable(self, *args, **kwargs):
         self.queries(self._createTable(*args, **kwargs))
         self.queries(self._createViews(args[0]))
+        self.db.invalidateCatalog(self.catalogNames(args[0]))
 
     def ensureTable(self, tableSpec):
-        res = not self.tableExists(tableSpec)
+        return self.ensureTables([tableSpec])[0]
+
+    def ensureTables(self, tableSpecs):
+        catalog = self.db.catalogColumns(
+            [tableSpec['name'] for tableSpec in tableSpecs])
+        res = [
+            catalog[tableSpec['name']] != set(TableSpecModel(tableSpec).allColumns()) for tableSpec in tableSpecs
+        ]
         qArgs = []
-        if res:
-            qArgs += self._createTable(tableSpec)
-            qArgs += self._createViews(tableSpec)
+        names = []
+        for tableSpec, create in zip(tableSpecs, res):
+            if create:
+                qArgs += self._createTable(tableSpec)
+                qArgs += self._createViews(tableSpec)
+                names += self.catalogNames(tableSpec)
+        if len(qArgs) > 0:
             self.queries(qArgs)
+            self.db.invalidateCatalog(names)
         return res
 
     def dropTable(self, tableSpec):
@@ -35,29 +49,48 @@ class ORM(ORMQueries):
         qArgs += self._dropViews(tableSpec)
         qArgs += self._dropTable(tableSpec)
         self.queries(qArgs)
+        self.db.invalidateCatalog(self.catalogNames(tableSpec))
 
     def dropView(self, viewName):
         self.queries(self._dropView(viewName))
+        self.db.invalidateCatalog([viewName])
 
     def dropViews(self, tableSpec):
         self.queries(self._dropViews(tableSpec))
+        self.db.invalidateCatalog(self.catalogNames(tableSpec)[1:])
 
     def tableExists(self, tableSpec):
         model = TableSpecModel(tableSpec)
         # allColumns = ', '.join(self.util.quote(model.allColumns()))
         return self.db.tableExists(tableSpec['name'], model.allColumns())
 
-    def insert(self, tableSpec, rows, fetchAll=False, returning=None, batchSize=None, debug=False):
+    def insert(self, tableSpec, rows, fetchAll=False, returning=None, batchSize=None, debug=False, mode=None):
         _batchSize = self.defBatchSize if batchSize is None else batchSize
-        qArgs = self._insert(
-            tableSpec, rows, returning=returning, batchSize=_batchSize)
-        res = self.queries(qArgs)
-        res = itertools.chain(*res)
+        res = itertools.chain(*[
+            self._insertRows(tableSpec, chunk, returning=returning,
+                             batchSize=_batchSize, mode=mode)
+            for chunk in self.chunks(rows, _batchSize)
+        ])
         if fetchAll:
             res = list(res)
         return res
 
-    def update(self, tableSpec, rows, debug=False, returning=None):
+    def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode is not None:
+            raise ORMError('Unknown insert mode {}.'.format(mode))
+        qArgs = self._insert(
+            tableSpec, rows, returning=returning, batchSize=batchSize)
+        return itertools.chain(*self.queries(qArgs))
+
+    def update(self, tableSpec, rows, debug=False, returning=None, batchSize=None, mode=None):
+        if mode == 'batch':
+            _batchSize = self.defBatchSize if batchSize is None else batchSize
+            batches = self._updateBatch(
+                tableSpec, rows, _batchSize, returning=returning)
+            batchRows = self.queries([qArgs for qArgs, _ in batches])
+            return self._updateBatchRows(tableSpec, rows, batches, batchRows, returning=returning)
+        if mode is not None:
+            raise ORMError('Unknown update mode {}.'.format(mode))
 
         qArgs = self._update(tableSpec, rows, debug, returning)
         updRows = self.queries(qArgs)
@@ -65,14 +98,31 @@ class ORM(ORMQueries):
         assert res is None or len(res) == len(rows)
         return res
 
-    def upsert(self, tableSpec, rows, fetchAll=False, batchSize=None, returning=None, debug=False):
+    def upsert(self, tableSpec, rows, fetchAll=False, batchSize=None, returning=None, debug=False, mode=None):
         _batchSize = self.defBatchSize if batchSize is None else batchSize
+        res = itertools.chain(*[
+            self._upsertRows(tableSpec, chunk, returning=returning,
+                             batchSize=_batchSize, mode=mode)
+            for chunk in self.chunks(rows, _batchSize)
+        ])
+        if fetchAll:
+            res = [r for r in res]
+        return res
+
+    def _upsertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode == 'onconflict':
+            qArgs = self._upsertOnConflict(
+                tableSpec, rows, batchSize=batchSize, returning=returning)
+            return self.upsertedRows(self.queries(qArgs))
+        if mode is not None:
+            raise ORMError('Unknown upsert mode {}.'.format(mode))
+
         _returning = self.prepareReturning(tableSpec, returning)
         updates, omits = self._upsertUpdate(
             tableSpec, rows, returning=_returning)
         res = self.queries(updates)
         ups, ins = self._upsertInsert(
-            tableSpec, rows, res, batchSize=_batchSize, returning=returning)
+            tableSpec, rows, res, batchSize=batchSize, returning=returning)
 
         assert ins is not None
         for i in ins:
@@ -85,12 +135,19 @@ class ORM(ORMQueries):
         ups = itertools.chain(*ups)
         ups = map(R.omit(omits), ups)
 
-        res = itertools.chain(*ins, ups)
-        if fetchAll:
-            res = [r for r in res]
-        return res
+        return itertools.chain(self.upsertedRows(ins), ups)
+
+    def delete(self, tableSpec, keyMaps, fetchAll=False, batchSize=None, mode=None):
+        if mode == 'keys':
+            _batchSize = self.defBatchSize if batchSize is None else batchSize
+            qArgs = self._deleteKeys(tableSpec, keyMaps, _batchSize)
+            res = itertools.chain(*self.queries(qArgs))
+            if fetchAll:
+                res = list(res)
+            return res
+        if mode is not None:
+            raise ORMError('Unknown delete mode {}.'.format(mode))
 
-    def delete(self, tableSpec, keyMaps, fetchAll=False):
         qArgs = self._deleteSelectQuery(tableSpec, keyMaps)
         res = itertools.chain(*self.queries(qArgs))
         qqArgs = []
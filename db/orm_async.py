@@ -2,6 +2,7 @@ import ramda as R
 import asyncio
 import itertools
 
+from .ormqueries import ORMError
 from .ormqueries import ORMQueries
 from .ormqueries import TableSpecModel
 
@@ -19,6 +20,10 @@ class ORM(ORMQueries):
     def queries(self, args):
         return asyncio.gather(*[self.query(_[0], **_[1]) for _ in args])
 
+    def stream(self, qpT, *args, **kwargs):
+        q, p, T = self.util.qpTSplit(qpT)
+        return self.db.stream((q, p, T), *args, **kwargs)
+
     async def tableExists(self, tableSpec):
         model = TableSpecModel(tableSpec)
         return await self.db.tableExists(tableSpec['name'], model.allColumns())
@@ -26,37 +31,97 @@ class ORM(ORMQueries):
     async def createTable(self, tableSpec):
         await self.queries(self._createTable(tableSpec))
         await self.queries(self._createViews(tableSpec))
+        self.db.invalidateCatalog(self.catalogNames(tableSpec))
 
     async def ensureTable(self, tableSpec):
-        res = not await self.tableExists(tableSpec)
-        if res:
-            await self.queries(self._createTable(tableSpec))
-            await self.queries(self._createViews(tableSpec))
+        return (await self.ensureTables([tableSpec]))[0]
+
+    async def ensureTables(self, tableSpecs):
+        catalog = await self.db.catalogColumns(
+            [tableSpec['name'] for tableSpec in tableSpecs])
+        res = [
+            catalog[tableSpec['name']] != set(TableSpecModel(tableSpec).allColumns()) for tableSpec in tableSpecs
+        ]
+        names = []
+        for tableSpec, create in zip(tableSpecs, res):
+            if create:
+                await self.queries(self._createTable(tableSpec))
+                await self.queries(self._createViews(tableSpec))
+                names += self.catalogNames(tableSpec)
+        self.db.invalidateCatalog(names)
         return res
 
-    def dropTable(self, tableSpec):
+    async def dropTable(self, tableSpec):
         qArgs = []
         qArgs += self._dropViews(tableSpec)
         qArgs += self._dropTable(tableSpec)
-        return self.queries(qArgs)
+        res = await self.queries(qArgs)
+        self.db.invalidateCatalog(self.catalogNames(tableSpec))
+        return res
 
-    async def insert(self, tableSpec, rows, returning=None, batchSize=None):
+    @classmethod
+    async def aChunks(cls, rows, size):
+        if not hasattr(rows, '__aiter__'):
+            for chunk in cls.chunks(rows, size):
+                yield chunk
+            return
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    async def insert(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
         _batchSize = self.defBatchSize if batchSize is None else batchSize
+        res = []
+        async for chunk in self.aChunks(rows, _batchSize):
+            res += await self._insertRows(tableSpec, chunk, returning=returning,
+                                          batchSize=_batchSize, mode=mode)
+        return res
+
+    async def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode is not None:
+            raise ORMError('Unknown insert mode {}.'.format(mode))
         qArgs = self._insert(
-            tableSpec, rows, returning=returning, batchSize=_batchSize)
+            tableSpec, rows, returning=returning, batchSize=batchSize)
         return R.unnest(await self.queries(qArgs))
 
-    async def update(self, tableSpec, rows, debug=False, returning=None):
+    async def update(self, tableSpec, rows, debug=False, returning=None, batchSize=None, mode=None):
+        if mode == 'batch':
+            _batchSize = self.defBatchSize if batchSize is None else batchSize
+            batches = self._updateBatch(
+                tableSpec, rows, _batchSize, returning=returning)
+            batchRows = await self.queries([qArgs for qArgs, _ in batches])
+            return self._updateBatchRows(tableSpec, rows, batches, batchRows, returning=returning)
+        if mode is not None:
+            raise ORMError('Unknown update mode {}.'.format(mode))
         qArgs = self._update(tableSpec, rows, debug, returning)
         updRows = await self.queries(qArgs)
         res = self.ensureSingleRows(updRows)
         assert res is None or len(res) == len(rows)
         return res
 
-    async def upsert(self, tableSpec, rows, returning=None, batchSize=None):
+    async def upsert(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        _batchSize = self.defBatchSize if batchSize is None else batchSize
+        res = []
+        async for chunk in self.aChunks(rows, _batchSize):
+            res += await self._upsertRows(tableSpec, chunk, returning=returning,
+                                          batchSize=_batchSize, mode=mode)
+        return res
+
+    async def _upsertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
         _returning = self.prepareReturning(tableSpec, returning)
 
-        _batchSize = self.defBatchSize if batchSize is None else batchSize
+        if mode == 'onconflict':
+            qArgs = self._upsertOnConflict(
+                tableSpec, rows, batchSize=batchSize, returning=returning)
+            return list(self.upsertedRows(await self.queries(qArgs)))
+        if mode is not None:
+            raise ORMError('Unknown upsert mode {}.'.format(mode))
+
         updates, omits = self._upsertUpdate(
             tableSpec, rows, returning=_returning)
         res = await self.queries(updates)
@@ -66,15 +131,22 @@ class ORM(ORMQueries):
             ) for rows in res
         )
         ups, ins = self._upsertInsert(
-            tableSpec, rows, res, batchSize=_batchSize, returning=returning)
+            tableSpec, rows, res, batchSize=batchSize, returning=returning)
         ups = itertools.chain(*ups)
         # ups = list(ups) #for debugging
         ins = await self.queries(ins)
         ups = map(R.omit(omits), ups)
         # ups = list(ups) #for debugging
-        return itertools.chain(*ins, ups)
+        return list(itertools.chain(self.upsertedRows(ins), ups))
+
+    async def delete(self, tableSpec, keyMaps, batchSize=None, mode=None):
+        if mode == 'keys':
+            _batchSize = self.defBatchSize if batchSize is None else batchSize
+            qArgs = self._deleteKeys(tableSpec, keyMaps, _batchSize)
+            return R.unnest(await self.queries(qArgs))
+        if mode is not None:
+            raise ORMError('Unknown delete mode {}.'.format(mode))
 
-    async def delete(self, tableSpec, keyMaps,):
         qArgs = self._deleteSelectQuery(tableSpec, keyMaps)
         res = R.unnest(await self.queries(qArgs))
         qqArgs = []
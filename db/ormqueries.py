@@ -1,7 +1,8 @@
-import json
 import ramda as R
 import itertools
 import inspect
+import re
+from collections import OrderedDict
 from typeguard import check_type
 from typeguard import typechecked
 from typing import Union
@@ -10,13 +11,31 @@ from contrib.p4thpymisc.src.misc import items
 from .ts import Ts
 
 
+class ORMError(Exception):
+    pass
+
+
 class ColumnSpecModel:
 
-    def __init__(self, columSpec):
+    def __init__(self, columSpec, nativeTypes=None):
         self.columnSpec = columSpec
+        self._transform = self.resolveTransform(columSpec, nativeTypes)
+
+    @staticmethod
+    def resolveTransform(columnSpec, nativeTypes=None):
+        # Declared types the driver converts need no Python transform,
+        # others fall back to the column transform or the type default.
+        type = columnSpec.get('type')
+        if type is not None and nativeTypes is not None and type in nativeTypes:
+            return nativeTypes[type]
+        if type is None or 'transform' in columnSpec:
+            return columnSpec.get('transform')
+        if type not in Ts.typeTransforms:
+            raise ORMError('Unknown column type {}.'.format(type))
+        return Ts.typeTransforms[type]
 
     def transform(self, val, inverse=False):
-        return val if 'transform' not in self.columnSpec else (self.columnSpec['transform'](val, inverse))
+        return val if self._transform is None else self._transform(val, inverse)
 
 
 class TableSpecModel:
@@ -27,10 +46,100 @@ class TableSpecModel:
     def allColumns(self, sort=True, quote=True):
         return [column for column, spec in items(self.tableSpec['columnSpecs'], sort=sort)]
 
-    def Ts(self, inverse=False):
-        return {
-            name: spec['transform'] for name, spec in items(self.tableSpec['columnSpecs'], sort=True) if 'transform' in spec
+    def Ts(self, inverse=False, nativeTypes=None):
+        TMap = {
+            name: ColumnSpecModel.resolveTransform(spec, nativeTypes)
+            for name, spec in items(self.tableSpec['columnSpecs'], sort=True)
         }
+        return {name: T for name, T in TMap.items() if T is not None}
+
+
+class CompiledTableSpec:
+
+    notNullRe = re.compile(r'\bNOT\s+NULL\b', re.IGNORECASE)
+    defaultRe = re.compile(r'\b(DEFAULT|GENERATED)\b', re.IGNORECASE)
+
+    def __init__(self, tableSpec, util, fingerprint=None, nativeTypes=None):
+        columnSpecs = tableSpec['columnSpecs']
+        self.tableSpec = tableSpec
+        self.fingerprint = self.fingerprintOf(
+            tableSpec) if fingerprint is None else fingerprint
+        self.util = util
+        self.table = util.quote(tableSpec['name'])
+        self.primaryKeys = list(tableSpec.get('primaryKeys', []))
+        self.allColumns = TableSpecModel(tableSpec).allColumns()
+        self.quoted = dict(zip(self.allColumns, util.quote(self.allColumns)))
+        self.TMap = TableSpecModel(tableSpec).Ts(nativeTypes=nativeTypes)
+        self.transforms = {
+            column: ColumnSpecModel(columnSpecs[column], nativeTypes).transform for column in self.allColumns
+        }
+        # columns an INSERT must set
+        self.requiredColumns = [
+            column for column in self.allColumns
+            if self.notNullRe.search(columnSpecs[column].get('definition', '')) is not None
+            and self.defaultRe.search(columnSpecs[column]['definition']) is None
+        ]
+        self.rowTransform = tableSpec.get('rowTransform')
+        self.selectQuery = 'SELECT {} FROM {}'.format(
+            self.quote(self.allColumns), self.table)
+        self._columnSets = {}
+        self._templates = {}
+        self._viewTMaps = {}
+
+    @staticmethod
+    def fingerprintOf(tableSpec):
+        return (
+            tableSpec['name'],
+            tuple((name, spec.get('definition'), spec.get('type'), spec.get('transform'))
+                  for name, spec in tableSpec['columnSpecs'].items()),
+            tuple(tableSpec.get('primaryKeys', [])),
+            tableSpec.get('rowTransform'),
+            tuple((view, tuple((name, cs.get('transform'))
+                               for name, cs in viewSpec['columnSpecs'].items()))
+                  for view, viewSpec in tableSpec.get('views', {}).items()),
+        )
+
+    def quote(self, columns):
+        return ', '.join([
+            self.quoted[column] if column in self.quoted else self.util.quote(column) for column in columns
+        ])
+
+    def columns(self, keys):
+        keys = frozenset(keys)
+        res = self._columnSets.get(keys)
+        if res is None:
+            columns = [column for column in self.allColumns if column in keys]
+            res = (columns, [self.transforms[column] for column in columns])
+            self._columnSets[keys] = res
+        return res
+
+    def template(self, kind, columns):
+        key = (kind, tuple(columns))
+        res = self._templates.get(key)
+        if res is None:
+            if kind == 'insert':
+                res = 'INSERT INTO {} ({}) VALUES '.format(
+                    self.table, self.quote(columns))
+            elif kind == 'update':
+                res = [self.quoted[column] + ' = ' for column in columns]
+            else:
+                raise ORMError('Unknown template {}.'.format(kind))
+            self._templates[key] = res
+        return res
+
+    def rowTransformer(self, TMap=None, rowMode=None):
+        T = Ts.RowTransformer(self.TMap if TMap is None else TMap, rowMode=rowMode)
+        if self.rowTransform is not None:
+            T.rowTransform = self.rowTransform
+        return T
+
+    def viewTMap(self, view):
+        res = self._viewTMaps.get(view)
+        if res is None:
+            res = {name: cs['transform'] for name, cs in items(
+                self.tableSpec['views'][view]['columnSpecs'], sort=True)}
+            self._viewTMaps[view] = res
+        return res
 
 
 class ORMQueries:
@@ -92,9 +201,43 @@ class ORMQueries:
 
         return [val] + res, _it
 
+    @classmethod
+    def chunks(cls, rows, size):
+        # Sequences are handled in one go, other iterables are consumed
+        # size rows at a time.
+        if isinstance(rows, (list, tuple)):
+            yield rows
+            return
+        it = iter(rows)
+        while True:
+            chunk = list(itertools.islice(it, size))
+            if len(chunk) < 1:
+                return
+            yield chunk
+
+    # Declared column types the driver converts, mapped to the transform still needed.
+    nativeTypes = {}
+
+    compiledMax = 256
+
     def __init__(self, util, pipe):
         self.pipe = pipe
         self.util = util
+        self._compiled = OrderedDict()
+
+    def compile(self, tableSpec):
+        # Keyed by content, least recently used specs are evicted.
+        fingerprint = CompiledTableSpec.fingerprintOf(tableSpec)
+        res = self._compiled.get(fingerprint)
+        if res is None:
+            res = CompiledTableSpec(
+                tableSpec, self.util, fingerprint, self.nativeTypes)
+            self._compiled[fingerprint] = res
+            if len(self._compiled) > self.compiledMax:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(fingerprint)
+        return res
 
     def _ensureTable(self, tableSpec):
 
@@ -136,13 +279,17 @@ class ORMQueries:
             ((q1, {}), {})
         ]
 
+    @staticmethod
+    def catalogNames(tableSpec):
+        return [tableSpec['name']] + list(tableSpec.get('views', {}).keys())
+
     def _dropTable(self, tableSpec):
         q = 'DROP TABLE IF  EXISTS {}'.format(
             self.util.quote(tableSpec['name']))
         return [((q, {}), {})]
 
     def _dropViews(self, tableSpec):
-        viewSpecs = tableSpec['views'] if 'views' in tableSpec else []
+        viewSpecs = tableSpec['views'] if 'views' in tableSpec else {}
         qArgs = []
         for viewName, viewSpec in viewSpecs.items():
             qArgs += self._dropView(viewName)
@@ -158,62 +305,180 @@ class ORMQueries:
         ] if 'rowTransform' in tableSpec \
             else rows
 
-    def _insert(self, tableSpec, groupedRows: tuple | list, batchSize, returning=None):
+    def _valueGroups(self, tableSpec, rows, indexed=False):
+        _rows = self.applyRowTransform(tableSpec, rows, False)
+        compiled = self.compile(tableSpec)
 
-        _rows = self.applyRowTransform(tableSpec, groupedRows, False)
-        model = TableSpecModel(tableSpec)
-        TMap = model.Ts()
-        columnModelMap = {
-            name: ColumnSpecModel(spec) for name, spec in items(tableSpec['columnSpecs'], sort=True)
-        }
+        rowGroups = {}
+        for i, row in enumerate(_rows):
+            rowGroups.setdefault(frozenset(row.keys()), []).append((i, row))
 
-        def insertHelper(rows):
+        res = []
+        for keys, groupedRows in rowGroups.items():
+            columns, transforms = compiled.columns(keys)
+            valueRows = [
+                tuple(f(r[c]) for c, f in zip(columns, transforms))
+                for _, r in groupedRows
+            ]
+            res.append((columns, valueRows, [i for i, _ in groupedRows])
+                       if indexed else (columns, valueRows))
+        return res
+
+    def _insert(self, tableSpec, groupedRows: tuple | list, batchSize, returning=None):
 
-            columns = [col for col in allColumns if col in rows[0]]
+        compiled = self.compile(tableSpec)
+
+        def insertHelper(columns, valueRows):
             p = {}
-            placeholders = [
-                [
-                    self.util.p(p, columnModelMap[c].transform(r[c]))
-                    for c in columns
-                ]
-                for r in rows
-            ]
-            placeholders = R.pipe(
-                R.map(lambda group: '(' + ', '.join(group) + ')'),
-                R.join(', '),
-            )(placeholders)
-
-            q = 'INSERT INTO {} ({}) VALUES {}'.format(self.util.quote(
-                tableSpec['name']), ', '.join(self.util.quote(columns)), placeholders)
-            qpT = (q, p, TMap)
+            placeholders = ', '.join([
+                '(' + ', '.join([self.util.p(p, val) for val in valueRow]) + ')'
+                for valueRow in valueRows
+            ])
+            q = compiled.template('insert', columns) + placeholders
+            qpT = (q, p, compiled.TMap)
             qpT = self._returning(tableSpec, qpT, returning)
             return qpT, {}
 
         if len(groupedRows) < 1:
             return []
 
-        allColumns = model.allColumns()
-
-        rowGroups = R.group_by(
-            lambda r: json.dumps(sorted(r.keys()))
-        )(_rows)
-
         res = []
-        for _, groupedRows in rowGroups.items():
+        for columns, valueRows in self._valueGroups(tableSpec, groupedRows):
             rowCtr = 0
-            while rowCtr < len(groupedRows):
-                res.append(insertHelper(groupedRows[rowCtr:rowCtr+batchSize]))
+            while rowCtr < len(valueRows):
+                res.append(insertHelper(
+                    columns, valueRows[rowCtr:rowCtr+batchSize]))
                 rowCtr += batchSize
 
         return res
 
+    def _upsertOnConflict(self, tableSpec, rows, batchSize, returning=None):
+        compiled = self.compile(tableSpec)
+        TMap = compiled.TMap
+        table = compiled.table
+        primaryKeys = tableSpec['primaryKeys']
+
+        def upsertHelper(columns, valueRows):
+            p = {}
+            placeholders = ', '.join([
+                '(' + ', '.join([self.util.p(p, val) for val in valueRow]) + ')'
+                for valueRow in valueRows
+            ])
+            updates = [col for col in columns if col not in primaryKeys]
+            updates = primaryKeys[:1] if len(updates) < 1 else updates
+            q = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                table, compiled.quote(columns), placeholders,
+                compiled.quote(primaryKeys),
+                ', '.join(['{col} = excluded.{col}'.format(col=compiled.quoted[col]) for col in updates]))
+            return self._returning(tableSpec, (q, p, TMap), returning), {}
+
+        res = []
+        for columns, valueRows in self._valueGroups(tableSpec, rows):
+            if not set(primaryKeys).issubset(columns):
+                raise ORMError('Rows to upsert must contain all primary keys.')
+            # Unlike the default upsert, every row is inserted first, so partial
+            # rows can not update existing records that have NOT NULL columns.
+            missing = [column for column in compiled.requiredColumns if column not in columns]
+            if len(missing) > 0:
+                raise ORMError('Rows to upsert with onconflict must contain the NOT NULL columns {}.'.format(
+                    ', '.join(missing)))
+            keyIndexes = [columns.index(key) for key in primaryKeys]
+            batch = []
+            keys = set()
+            for valueRow in valueRows:
+                key = tuple(valueRow[i] for i in keyIndexes)
+                # A statement may not update the same row twice.
+                if len(batch) >= batchSize or key in keys:
+                    res.append(upsertHelper(columns, batch))
+                    batch = []
+                    keys = set()
+                batch.append(valueRow)
+                keys.add(key)
+            if len(batch) > 0:
+                res.append(upsertHelper(columns, batch))
+        return res
+
+    def _updateBatch(self, tableSpec, rows, batchSize, returning=None):
+        table = self.util.quote(tableSpec['name'])
+        primaryKeys = tableSpec['primaryKeys']
+        columnSpecs = tableSpec['columnSpecs']
+        _returning = self.prepareReturning(tableSpec, returning)
+        _returning = _returning.union(primaryKeys) if len(_returning) > 0 else _returning
+
+        def value(col):
+            return self.util.cast('_v.{}'.format(self.util.quote('_v_' + col)),
+                                  columnSpecs[col]['definition'])
+
+        def updateHelper(columns, valueRows):
+            p = {}
+            values = ', '.join([
+                '(' + ', '.join([self.util.p(p, val) for val in valueRow]) + ')'
+                for valueRow in valueRows
+            ])
+            updates = [col for col in columns if col not in primaryKeys]
+            updates = primaryKeys[:1] if len(updates) < 1 else updates
+            q = 'WITH _v ({}) AS (VALUES {}) UPDATE {} SET {} FROM _v WHERE {}'.format(
+                ', '.join(self.util.quote(['_v_' + col for col in columns])), values, table,
+                ', '.join(['{} = {}'.format(self.util.quote(col), value(col))
+                          for col in updates]),
+                ' AND '.join(['{} = {}'.format(self.util.quote(key), value(key)) for key in primaryKeys]))
+            if len(_returning) > 0:
+                q = '{} RETURNING {}'.format(
+                    q, ', '.join(self.util.quote(sorted(_returning))))
+            return (q, p), {}
+
+        res = []
+        for columns, valueRows, indexes in self._valueGroups(tableSpec, rows, indexed=True):
+            if not set(primaryKeys).issubset(columns):
+                raise ORMError('Rows to update must contain all primary keys.')
+            if len(columns) <= len(primaryKeys) and len(_returning) < 1:
+                continue
+            keyIndexes = [columns.index(key) for key in primaryKeys]
+            batch = []
+            keys = []
+            keySet = set()
+            for i, valueRow in zip(indexes, valueRows):
+                key = tuple(valueRow[j] for j in keyIndexes)
+                # A row matching several VALUES rows is updated only once.
+                if len(batch) >= batchSize or key in keySet:
+                    res.append((updateHelper(columns, batch), keys))
+                    batch = []
+                    keys = []
+                    keySet = set()
+                batch.append(valueRow)
+                keys.append((i, key))
+                keySet.add(key)
+            if len(batch) > 0:
+                res.append((updateHelper(columns, batch), keys))
+        return res
+
+    def _updateBatchRows(self, tableSpec, rows, batches, batchRows, returning=None):
+        primaryKeys = tableSpec['primaryKeys']
+        _returning = self.prepareReturning(tableSpec, returning)
+        res = [None] * len(rows)
+        if len(_returning) < 1:
+            return res
+
+        compiled = self.compile(tableSpec)
+        keyTransforms = [compiled.transforms[key] for key in primaryKeys]
+        T = compiled.rowTransformer()
+        omits = R.difference(primaryKeys, list(_returning))
+        for (_, keys), updRows in zip(batches, batchRows):
+            # keys hold transformed values, the returned ones are raw
+            rowMap = {
+                tuple(f(row[key]) for key, f in zip(primaryKeys, keyTransforms)): row
+                for row in (updRows or [])
+            }
+            for i, key in keys:
+                row = rowMap.get(key)
+                res[i] = None if row is None else R.omit(omits)(T(row, True))
+        return res
+
     def _returning(self, tableSpec, qpTMap, returning=None):
         _returning = self.prepareReturning(tableSpec, returning, asString=True)
         q, p, TMap = self.util.qpTSplit(qpTMap)
         check_type(TMap, Union[dict, None])
-        T = Ts.RowTransformer(TMap)
-        if 'rowTransform' in tableSpec:
-            T.rowTransform = tableSpec['rowTransform']
+        T = self.compile(tableSpec).rowTransformer(TMap)
         q = '{} {}'.format(q, _returning)
         return (q, p, T)
 
@@ -226,6 +491,11 @@ class ORMQueries:
 
         return len(nextRows) == 1, _rows
 
+    @staticmethod
+    def upsertedRows(results):
+        # statements without RETURNING may come back without any result set
+        return itertools.chain.from_iterable(rows for rows in results if rows is not None)
+
     def ensureSingleRows(self, updRows):
 
         res = [None] * len(updRows)
@@ -239,55 +509,42 @@ class ORMQueries:
 
         _rows = self.applyRowTransform(tableSpec, rows, False)
         qArgs = []
-        tsModel = TableSpecModel(tableSpec)
-        TMap = tsModel.Ts()
+        compiled = self.compile(tableSpec)
+        primaryKeys = compiled.primaryKeys
 
-        valueColumns = set(tableSpec['columnSpecs'].keys()).difference(
-            set(tableSpec['primaryKeys']))
+        valueColumns = set(compiled.allColumns).difference(set(primaryKeys))
         if len(valueColumns) < 1 and returning is None:
             return
-        valSpecs = {
-            col: ColumnSpecModel(tableSpec['columnSpecs'][col]) for i, col in items(valueColumns, sort=True)
-        }
-        keySpecs = {
-            col: ColumnSpecModel(tableSpec['columnSpecs'][col]) for i, col in items(tableSpec['primaryKeys'], sort=True)
-        }
-        valSpecs = {**keySpecs, **valSpecs}
 
         for i, row in enumerate(_rows):
-            valRow = self.valuesFromRow(valSpecs.keys(), row)
+            valRow = self.valuesFromRow(compiled.allColumns, row)
+            valColumns, valTransforms = compiled.columns(valRow.keys())
             p = {}
             valAssigns = [
-                '{} = {}'.format(self.util.quote(col), self.util.p(
-                    p, spec.transform(valRow[col], inverse=False)))
-                for col, spec in items(valSpecs, sort=True)
-                if col in valRow
+                assign + self.util.p(p, f(valRow[col]))
+                for assign, col, f in zip(compiled.template('update', valColumns), valColumns, valTransforms)
             ]
 
-            keyRow = self.keysFromRow(valSpecs.keys(), row)
+            keyRow = self.keysFromRow(compiled.allColumns, row)
+            keyColumns, keyTransforms = compiled.columns(
+                set(keyRow.keys()).intersection(primaryKeys))
             keyWheres = [
-                '{} = {}'.format(self.util.quote(col), self.util.p(
-                    p, spec.transform(keyRow[col], inverse=False)))
-                for col, spec in items(keySpecs, sort=True)
-                if col in keyRow
+                assign + self.util.p(p, f(keyRow[col]))
+                for assign, col, f in zip(compiled.template('update', keyColumns), keyColumns, keyTransforms)
             ]
 
             if len(valAssigns) > 0:
-                q = 'UPDATE {} SET {} WHERE {}'.format(self.util.quote(tableSpec['name']),
+                q = 'UPDATE {} SET {} WHERE {}'.format(compiled.table,
                                                        ','.join(valAssigns),
                                                        ' AND '.join(keyWheres)
                                                        )
-                qpT = self._returning(tableSpec, (q, p, TMap), returning)
+                qpT = self._returning(tableSpec, (q, p, compiled.TMap), returning)
             else:
                 q = 'SELECT {} FROM {} WHERE {}'.format(','.join(self.util.quote(returning)),
-                                                        self.util.quote(
-                                                            tableSpec['name']),
+                                                        compiled.table,
                                                         ' AND '.join(keyWheres)
                                                         )
-                T = Ts.RowTransformer(TMap)
-                if 'rowTransform' in tableSpec:
-                    T.rowTransform = tableSpec['rowTransform']
-                qpT = (q, p, T)
+                qpT = (q, p, compiled.rowTransformer())
             qArgs.append((qpT, {}))
         return qArgs
 
@@ -334,10 +591,10 @@ class ORMQueries:
     def _deleteSelectQuery(self, tableSpec, keyMaps):
 
         p = {}
+        transforms = self.compile(tableSpec).transforms
         keyMapsT = [
             {
-                col: ColumnSpecModel(
-                    tableSpec['columnSpecs'][col]).transform(val)
+                col: transforms[col](val)
                 for col, val in items(keyMap)
             } for keyMap in keyMaps
         ]
@@ -360,10 +617,41 @@ class ORMQueries:
 
         return [((q, p, T), {})]
 
+    def _deleteKeys(self, tableSpec, keyMaps, batchSize):
+        primaryKeys = tableSpec['primaryKeys']
+        columnSpecs = tableSpec['columnSpecs']
+        compiled = self.compile(tableSpec)
+        keyTransforms = [compiled.transforms[key] for key in primaryKeys]
+        T = compiled.rowTransformer()
+
+        keyRows = []
+        for keyMap in keyMaps:
+            if not set(primaryKeys).issubset(keyMap.keys()):
+                raise ORMError('Keys to delete must contain all primary keys.')
+            keyRows.append([f(keyMap[key])
+                           for key, f in zip(primaryKeys, keyTransforms)])
+
+        def deleteHelper(keyRows):
+            p = {}
+            values = ', '.join([
+                '(' + ', '.join([
+                    self.util.cast(self.util.p(p, val), columnSpecs[key]['definition'])
+                    for key, val in zip(primaryKeys, keyRow)
+                ]) + ')'
+                for keyRow in keyRows
+            ])
+            q = 'DELETE FROM {} WHERE ({}) IN (VALUES {}) RETURNING {}'.format(
+                compiled.table, compiled.quote(primaryKeys),
+                values, compiled.quote(compiled.allColumns))
+            return (q, p, T), {}
+
+        return [
+            deleteHelper(keyRows[i:i + batchSize]) for i in range(0, len(keyRows), batchSize)
+        ]
+
     # Todo: Write more efficient method in db specific orm classes.
     def _deleteDeleteQuery(self, tableSpec, q, p):
 
-        tss = TableSpecModel(tableSpec)
         table = self.util.quote(tableSpec['name'])
         keys = [self.util.quote(key) for key in tableSpec['primaryKeys']]
 
@@ -374,36 +662,23 @@ class ORMQueries:
         ])
 
         q = 'DELETE FROM {} WHERE EXISTS ({} WHERE {})'.format(table, q, where)
-        T = Ts.RowTransformer(tss.Ts())
-        if 'rowTransform' in tableSpec:
-            T._rowTransform = tableSpec['rowTransform']
+        T = self.compile(tableSpec).rowTransformer()
 
         return [((q, p, T), {})]
 
-    def select(self, tableSpec):
-        tss = TableSpecModel(tableSpec)
-        allColumns = ', '.join(self.util.quote(tss.allColumns()))
-        q = 'SELECT {} FROM {}'.format(
-            allColumns, self.util.quote(tableSpec['name']))
+    def select(self, tableSpec, rowMode=None):
+        compiled = self.compile(tableSpec)
         p = []
-        T = Ts.RowTransformer(tss.Ts())
-        if 'rowTransform' in tableSpec:
-            T._rowTransform = tableSpec['rowTransform']
-        return q, p, T
-
-    def view(self, tableSpec, view):
-        viewSpec = tableSpec['views'][view]
+        T = compiled.rowTransformer(rowMode=rowMode)
+        return compiled.selectQuery, p, T
 
-        tss = TableSpecModel(tableSpec)
-        csModels = {
-            name: ColumnSpecModel(spec) for name, spec in viewSpec['columnSpecs'].items()
-        }
-        allColumns = ', '.join(self.util.quote(tss.allColumns()))
+    def view(self, tableSpec, view, rowMode=None):
+        compiled = self.compile(tableSpec)
 
-        q = 'SELECT {} FROM {}'.format(allColumns, self.util.quote(view))
+        q = 'SELECT {} FROM {}'.format(
+            compiled.quote(compiled.allColumns), self.util.quote(view))
         p = []
-        T = Ts.RowTransformer({name: cs['transform'] for name, cs in items(
-            viewSpec['columnSpecs'], sort=True)})
+        T = Ts.RowTransformer(compiled.viewTMap(view), rowMode=rowMode)
         return (q, p, T)
 
     @staticmethod
@@ -1,11 +1,17 @@
+from collections import deque
 from json import dumps
+from uuid import uuid4
 import psycopg
+from psycopg.types.json import set_json_dumps
+from psycopg.types.json import set_json_loads
 from xxhash import xxh32
 
 from ..db import DB as DB0
 from ..db import DBError as DBError0
+from ..db import Fetcher
 from .util import Util
 from .pipes import Pipes
+from .prepared import PreparedStatements
 from ..ts import Ts
 import re
 
@@ -15,6 +21,11 @@ try:
 except Exception as e:
     SubProcessHelper = 'Error: SubProcessHelper: ' + str(e)
 
+try:
+    import orjson
+except Exception as e:
+    orjson = 'Error: orjson: ' + str(e)
+
 parameterMatchers = [
     r'([(][{}].*?)'.format(Util.pNamePrefix)  # <-- safe form = (:...)s
 ]
@@ -28,6 +39,15 @@ class DBError(DBError0):
     pass
 
 
+class PipelineError(DBError):
+
+    def __init__(self, index, qpT, error):
+        super().__init__('Pipelined statement {} failed: {}'.format(index, error))
+        self.index = index
+        self.qpT = qpT
+        self.error = error
+
+
 class DB(DB0):
 
     @staticmethod
@@ -49,21 +69,77 @@ class DB(DB0):
         from .util import Util as _PGUtil
         return _PGUtil()
 
-    def __init__(self, url=None, log=None, **kwargs):
+    def __init__(self, url=None, log=None, itersize=2000, pool=None, prepareThreshold=None, preparedMax=100,
+                 pipelineMode=False, fastJSON=False, **kwargs):
         super().__init__(self.createUtil(),
                          idArgs=self._makeArgs((), {'url': url}),
                          cloneArgs=self._makeArgs(
-                             (), {**kwargs, 'url': url, 'log': log}),
+                             (), {**kwargs, 'url': url, 'log': log, 'itersize': itersize, 'pool': pool,
+                                  'prepareThreshold': prepareThreshold, 'preparedMax': preparedMax,
+                                  'pipelineMode': pipelineMode, 'fastJSON': fastJSON}),
                          log=log)
 
         self._url = self.createURL(**kwargs) if url is None else url
+        self.itersize = itersize
+        self.pool = pool
+        self.prepared = None if prepareThreshold is None \
+            else PreparedStatements(prepareThreshold, preparedMax)
+        self.pipelineMode = pipelineMode
+        if fastJSON and isinstance(orjson, str):
+            raise DBError(orjson)
+        self.fastJSON = fastJSON
 
         self.log.debug('url %s' % self.url)
         self.db = self.connect()
         self._cursor = None
 
     def connect(self):
-        return psycopg.connect(self.url, autocommit=True)
+        if self.pool is not None:
+            db = self.pool.getconn()
+        else:
+            db = psycopg.connect(self.url, autocommit=True)
+        if self.prepared is not None:
+            self.prepared.configure(db)
+        self.configureTypes(db)
+        return db
+
+    @staticmethod
+    def dumpsJSON(obj):
+        # Keeps the behaviour of the stdlib dumps psycopg uses by default:
+        # non str keys are converted, anything orjson refuses goes to json.
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return dumps(obj)
+
+    def configureTypes(self, connection):
+        # json and jsonb values are converted by orjson on request only, it
+        # reads integers wider than 64 bits as floats.
+        if self.fastJSON:
+            set_json_loads(orjson.loads, connection)
+            set_json_dumps(DB.dumpsJSON, connection)
+
+    def prepare(self, q, p):
+        if self.prepared is None:
+            return q, p, None
+        q, p = self.prepared.normalize(q, p)
+        return q, p, self.prepared.prepare(q)
+
+    @property
+    def preparedStats(self):
+        return {} if self.prepared is None else self.prepared.stats
+
+    def release(self, connection):
+        if self.pool is not None:
+            self.pool.putconn(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        if getattr(self, 'db', None) is None:
+            return
+        self.release(self.db)
+        self.db = None
 
     @classmethod
     def createURL(cls, **kwargs):
@@ -82,11 +158,52 @@ class DB(DB0):
 
     def __del__(self):
         self.log.debug('Closing db!')
-        if hasattr(self, 'db'):
-            self.db.close()
-            self.db = None
+        self.close()
+
+    def _queryHelper(self, qpT, transformer=None, stripParams=False, fetch=True, debug=None, stream=False):
+
+        def createStreamFetchOne(_cursor, _connection):
+
+            names = [c.name for c in _cursor.description]
+            batch = deque()
+
+            def close():
+                nonlocal _connection
+                batch.clear()
+                if not _cursor.closed:
+                    _cursor.close()
+                if _connection is not None:
+                    status = _connection.info.transaction_status
+                    if status == psycopg.pq.TransactionStatus.INTRANS:
+                        _connection.execute('COMMIT')
+                    elif status == psycopg.pq.TransactionStatus.INERROR:
+                        _connection.execute('ROLLBACK')
+                    self.release(_connection)
+                    _connection = None
+
+            def fetchMany(size=None):
+                size = _cursor.itersize if size is None else size
+                rows = [batch.popleft() for _ in range(min(size, len(batch)))]
+                if len(rows) < size and not _cursor.closed:
+                    rows += _cursor.fetchmany(size - len(rows))
+                    if len(rows) < size:
+                        close()
+                return rows
+
+            def fetchOne():
+                if len(batch) < 1:
+                    batch.extend(fetchMany())
+                return batch.popleft() if len(batch) > 0 else None
+
+            def fetchAll():
+                rows = list(batch)
+                batch.clear()
+                if not _cursor.closed:
+                    rows += _cursor.fetchall()
+                    close()
+                return rows
 
-    def _queryHelper(self, qpT, transformer=None, stripParams=False, fetch=True, debug=None):
+            return Fetcher(names, fetchOne, fetchAll, fetchMany, close)
 
         def createFetchOne(_cursor):
 
@@ -94,19 +211,26 @@ class DB(DB0):
                 _cursor.close()
 
             if not _cursor.description:
-                return fetchEmpty
+                return Fetcher((), fetchEmpty)
 
-            names = [c.name for c in _cursor.description] \
-                if _cursor.description is not None else []
+            names = [c.name for c in _cursor.description]
 
             def fetchOne():
                 if _cursor.closed:
                     return
-                values = _cursor.fetchone()
-                if values:
-                    return dict(zip(names, values))
+                return _cursor.fetchone()
+
+            def fetchAll():
+                if _cursor.closed:
+                    return []
+                return _cursor.fetchall()
+
+            def fetchMany(size=None):
+                if _cursor.closed:
+                    return []
+                return _cursor.fetchmany(self.itersize if size is None else size)
 
-            return fetchOne
+            return Fetcher(names, fetchOne, fetchAll, fetchMany)
 
         try:
             util = self.createUtil()
@@ -116,8 +240,28 @@ class DB(DB0):
 
             self.log.debug('q,p,T: %s, %s, %s' % (q, p, T))
 
+            if stream:
+                # Outside a transaction the stream gets a connection and a
+                # transaction of its own, which end when the rows run out or
+                # the fetcher is closed. WITH HOLD would materialize the whole
+                # result before the first row.
+                idle = self.db.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+                connection = self.connect() if idle else self.db
+                try:
+                    if idle:
+                        connection.execute('BEGIN')
+                    cursor = connection.cursor(name='_stream_' + uuid4().hex)
+                    cursor.itersize = self.itersize
+                    cursor.execute(q, p)
+                except Exception:
+                    if idle:
+                        self.release(connection)
+                    raise
+                return createStreamFetchOne(cursor, connection if idle else None)
+
+            q, p, prepare = self.prepare(q, p)
             cursor = self.cursor
-            cursor.execute(q, p)
+            cursor.execute(q, p, prepare=prepare)
             # description = cursor.description
 
             # assert description is not None
@@ -146,29 +290,96 @@ class DB(DB0):
             print('')
             raise e
 
+    @staticmethod
+    def pipelineError(args, cursors, e):
+        # Statements of a failed pipeline after the failing one get no results.
+        index = next((i for i, cursor in enumerate(cursors)
+                     if cursor.pgresult is None), len(cursors) - 1)
+        return PipelineError(index, args[index][0], e)
+
+    def queryPipeline(self, args):
+        # All statements are sent in one flush, the results come back in order.
+        args = list(args)
+        executed = []
+        try:
+            with self.db.pipeline():
+                for qpT, kwargs in args:
+                    q, p, T = self.util.qpTSplit(qpT)
+                    q = DB.protectMod(q)
+                    q, p, prepare = self.prepare(q, p)
+                    cursor = self.db.cursor()
+                    executed.append((cursor, T, kwargs))
+                    cursor.execute(q, p, prepare=prepare)
+        except psycopg.Error as e:
+            error = self.pipelineError(args, [cursor for cursor, _, _ in executed], e)
+            for cursor, _, _ in executed:
+                cursor.close()
+            raise error from e
+
+        res = []
+        for cursor, T, kwargs in executed:
+            with cursor:
+                names = [] if cursor.description is None else [
+                    c.name for c in cursor.description]
+                rows = [] if cursor.description is None else cursor.fetchall()
+            rowsT = self.createRowsT(names, T, kwargs.get(
+                'transformer'), kwargs.get('rowMode'))
+            res.append(rowsT(rows) if kwargs.get('fetchAll')
+                       else (row for row in rowsT(rows)))
+        return res
+
     def tableExists(self, table, columnNames):
-        schema, _table = self.util.schemaTableSplit(table)
+        return self.catalogColumns([table])[table] == set(columnNames)
+
+    def catalogQuery(self, tables):
+        # Unqualified names resolve along the search_path, as in queries, and
+        # come back without a schema.
         p = {}
+        pairs = [self.util.schemaTableSplit(table) for table in tables]
+        names = [tbl for sch, tbl in pairs if sch is None]
+        qualified = [(sch, tbl) for sch, tbl in pairs if sch is not None]
         q = """
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE  table_name = {} AND ({} = 1 OR table_schema = {})
-        LIMIT 2
-        """.format(*self.util.ps(p, [table, 0 if schema else 1, schema]))
-        rows = [r for r in self.query((q, p), debug=False)]
-        if len(rows) != 1:
-            return False
-
+        SELECT {} AS "schema", c.relname AS "table", a.attname AS "column"
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        WHERE c.relkind IN ('r', 'v', 'm', 'f', 'p') AND {}
+        """
+        qs = []
+        if len(names) > 0:
+            qs.append(q.format('NULL::name', 'c.relname IN ({}) AND pg_table_is_visible(c.oid)'.format(
+                ', '.join(self.util.ps(p, names)))))
+        if len(qualified) > 0:
+            qs.append(q.format('n.nspname', '(n.nspname, c.relname) IN ({})'.format(', '.join([
+                '({}, {})'.format(self.util.p(p, sch), self.util.p(p, tbl)) for sch, tbl in qualified
+            ]))))
+        return ' UNION ALL '.join(qs), p
+
+    def columnTypes(self, table):
         p = {}
         q = """
-        SELECT *
-        FROM information_schema.columns
-        WHERE  table_name = {} AND ({} = 1 OR table_schema = {})
-        """.format(*self.util.ps(p, [table, 0 if schema else 1, schema]))
-        rows = self.query((q, p), debug=False)
-        a = set([row['column_name'] for row in rows])
-        b = set(columnNames)
-        return a.issubset(b) and b.issubset(a)
+        SELECT a.attname AS "name", a.atttypid::int AS "oid"
+        FROM pg_attribute a
+        WHERE a.attrelid = {}::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """.format(self.util.p(p, self.util.quote(table)))
+        return {row['name']: row['oid'] for row in self.query((q, p))}
+
+    def copyQuery(self, table, columns, binary=False):
+        return 'COPY {} ({}) FROM STDIN{}'.format(
+            self.util.quote(table), ', '.join(self.util.quote(columns)),
+            ' (FORMAT BINARY)' if binary else '')
+
+    def copy(self, table, columns, rows, binary=False, types=None):
+        if binary and types is None:
+            typeMap = self.columnTypes(table)
+            types = [typeMap[column] for column in columns]
+        with self.db.cursor() as cursor:
+            with cursor.copy(self.copyQuery(table, columns, binary)) as copy:
+                if binary:
+                    copy.set_types(types)
+                for row in rows:
+                    copy.write_row(row)
+            return cursor.rowcount
 
     def exportToFile(self, path, invert=False, explain=False, schemas=None, restoreTables=None, create=False):
 
@@ -1,6 +1,7 @@
 import psycopg
-import ramda as R
+from contextlib import nullcontext
 from typing import Union
+from uuid import uuid4
 from typeguard import check_type
 
 from .db import DB as DB_pgsql
@@ -18,31 +19,108 @@ class DB(DB_pgsql):
         from .orm_async import ORM as _PGORM
         return _PGORM(db)
 
-    async def query(self, qpT, transformer=None, stripParams=False, debug=None):
+    async def query(self, qpT, transformer=None, stripParams=False, debug=None, rowMode=None):
 
         q, p, T = self.util.qpTSplit(qpT)
         q = DB.protectMod(q)
 
         check_type(T, Union[Ts.RowTransformer, dict, None])
-        if isinstance(T, dict) and not callable(T):
-            T = Ts.RowTransformer(T)
-        pipes = []
-        if callable(T):
-            pipes.append(
-                lambda row: T(row, inverse=True)
-            )
-        if callable(transformer):
-            pipes.append(transformer)
-        _T = R.pipe(*pipes) if len(pipes) > 0 else lambda r: r
 
+        q, p, prepare = self.prepare(q, p)
         async with await self.async_cursor as cursor:
-            await cursor.execute(q, p)
+            await cursor.execute(q, p, prepare=prepare)
             if cursor.rownumber is not None:
+                names = [c.name for c in cursor.description]
                 rows = await cursor.fetchall()
             else:
                 return None
 
-        return [_T(row) for row in rows]
+        return self.createRowsT(names, T, transformer, rowMode)(rows)
+
+    async def queryPipeline(self, args):
+        # All statements are sent in one flush, the results come back in order.
+        args = list(args)
+        db = await self.async_db
+        executed = []
+        try:
+            async with db.pipeline():
+                for qpT, kwargs in args:
+                    q, p, T = self.util.qpTSplit(qpT)
+                    q = DB.protectMod(q)
+
+                    check_type(T, Union[Ts.RowTransformer, dict, None])
+
+                    q, p, prepare = self.prepare(q, p)
+                    cursor = db.cursor()
+                    executed.append((cursor, T, kwargs))
+                    await cursor.execute(q, p, prepare=prepare)
+        except psycopg.Error as e:
+            error = self.pipelineError(args, [cursor for cursor, _, _ in executed], e)
+            for cursor, _, _ in executed:
+                await cursor.close()
+            raise error from e
+
+        res = []
+        for cursor, T, kwargs in executed:
+            async with cursor:
+                if cursor.description is None:
+                    res.append(None)
+                    continue
+                names = [c.name for c in cursor.description]
+                rows = await cursor.fetchall()
+            rowsT = self.createRowsT(names, T, kwargs.get(
+                'transformer'), kwargs.get('rowMode'))
+            res.append(rowsT(rows))
+        return res
+
+    async def stream(self, qpT, transformer=None, stripParams=False, debug=None, rowMode=None, batchSize=None):
+
+        q, p, T = self.util.qpTSplit(qpT)
+        q = DB.protectMod(q)
+        batchSize = self.itersize if batchSize is None else batchSize
+
+        check_type(T, Union[Ts.RowTransformer, dict, None])
+
+        db = await self.async_db
+        # Outside a transaction the stream gets a connection and a transaction
+        # of its own, WITH HOLD would materialize the whole result before the
+        # first row.
+        idle = db.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+        connection = await self.aconnect() if idle else db
+        try:
+            async with connection.transaction() if idle else nullcontext():
+                async with connection.cursor(name='_stream_' + uuid4().hex) as cursor:
+                    await cursor.execute(q, p)
+                    if cursor.description is None:
+                        return
+                    names = [c.name for c in cursor.description]
+                    rowsT = self.createRowsT(names, T, transformer, rowMode)
+                    while True:
+                        rows = await cursor.fetchmany(batchSize)
+                        if len(rows) < 1:
+                            break
+                        for row in rowsT(rows):
+                            yield row
+        finally:
+            if idle:
+                await self.arelease(connection)
+
+    async def queryColumnar(self, qpT, stripParams=False, numpy=False, debug=None):
+
+        q, p, T = self.util.qpTSplit(qpT)
+        q = DB.protectMod(q)
+
+        check_type(T, Union[Ts.RowTransformer, dict, None])
+
+        q, p, prepare = self.prepare(q, p)
+        async with await self.async_cursor as cursor:
+            await cursor.execute(q, p, prepare=prepare)
+            if cursor.rownumber is None:
+                return {}
+            names = [c.name for c in cursor.description]
+            rows = await cursor.fetchall()
+
+        return self.columnar(names, rows, T, numpy=numpy)
 
     def __init__(self, url=None, log=None, aSync=False, **kwargs):
         super().__init__(url, log, **kwargs)
@@ -51,41 +129,71 @@ class DB(DB_pgsql):
         self._async_db = None
 
     def __del__(self):
+        if getattr(self, '_async_db', None) is not None:
+            if self.pool is not None:
+                self.pool.aputconnSoon(self._async_db)
+            else:
+                # close() is a coroutine, finish the libpq connection directly.
+                self._async_db.pgconn.finish()
+            self._async_db = None
+        self.sync.close()
+
+    async def arelease(self, connection):
+        if self.pool is not None:
+            await self.pool.aputconn(connection)
+        else:
+            await connection.close()
+
+    async def close(self):
         if self._async_db is not None:
-            self._async_db.close()
+            await self.arelease(self._async_db)
             self._async_db = None
+        self.sync.close()
 
-    def connect(self):
-        return psycopg.connect(self.url, autocommit=True)
+    async def catalogColumns(self, tables):
+        missing = self.catalogMissing(tables)
+        if len(missing) > 0:
+            self.catalogUpdate(missing, await self.query(self.catalogQuery(missing)))
+        return {table: self._catalog[table] for table in tables}
 
     async def tableExists(self, table, columnNames):
-        schema, _table = self.util.schemaTableSplit(table)
-        p = {}
-        q = """
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE  table_name = {} AND ({} = 1 OR table_schema = {})
-        LIMIT 2
-        """.format(*self.util.ps(p, [table, 0 if schema else 1, schema]))
-        rows = [r for r in await self.query((q, p), debug=False)]
-        if len(rows) != 1:
-            return False
+        return (await self.catalogColumns([table]))[table] == set(columnNames)
 
+    async def columnTypes(self, table):
         p = {}
         q = """
-        SELECT *
-        FROM information_schema.columns
-        WHERE  table_name = {} AND ({} = 1 OR table_schema = {})
-        """.format(*self.util.ps(p, [table, 0 if schema else 1, schema]))
-        rows = await self.query((q, p), debug=False)
-        a = set([row['column_name'] for row in rows])
-        b = set(columnNames)
-        return a.issubset(b) and b.issubset(a)
+        SELECT a.attname AS "name", a.atttypid::int AS "oid"
+        FROM pg_attribute a
+        WHERE a.attrelid = {}::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """.format(self.util.p(p, self.util.quote(table)))
+        return {row['name']: row['oid'] for row in await self.query((q, p))}
+
+    async def copy(self, table, columns, rows, binary=False, types=None):
+        if binary and types is None:
+            typeMap = await self.columnTypes(table)
+            types = [typeMap[column] for column in columns]
+        async with await self.async_cursor as cursor:
+            async with cursor.copy(self.copyQuery(table, columns, binary)) as copy:
+                if binary:
+                    copy.set_types(types)
+                for row in rows:
+                    await copy.write_row(row)
+            return cursor.rowcount
+
+    async def aconnect(self):
+        if self.pool is not None:
+            db = await self.pool.agetconn()
+        else:
+            db = await psycopg.AsyncConnection.connect(self.url, autocommit=True)
+        if self.prepared is not None:
+            self.prepared.configure(db)
+        self.configureTypes(db)
+        return db
 
     @property
     async def async_db(self):
         if self._async_db is None:
-            self._async_db = await psycopg.AsyncConnection.connect(self.url, autocommit=True, row_factory=psycopg.rows.dict_row)
+            self._async_db = await self.aconnect()
         return self._async_db
 
     @property
@@ -1,11 +1,46 @@
+import itertools
 
 from ..orm import ORM as ORM0
+from .ormqueries import ORMQueries
 from .pipes import Pipes
 from .util import Util
 
-class ORM(ORM0):
+class ORM(ORMQueries, ORM0):
 
     __DEBUG__ = False
     
     def __init__(self, db):
-        super().__init__(db, Util(), Pipes())
+        util = Util()
+        super().__init__(db, util, Pipes(util))
+
+    def queries(self, args):
+        args = list(args)
+        if not self.db.pipelineMode or len(args) < 2:
+            return super().queries(args)
+        return self.db.queryPipeline(args)
+
+    def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode not in self.copyModes:
+            return super()._insertRows(tableSpec, rows, returning=returning, batchSize=batchSize, mode=mode)
+
+        binary = self.copyModes[mode]
+        typeMap = self.db.columnTypes(tableSpec['name']) if binary else None
+        _returning = self.prepareReturning(tableSpec, returning)
+        res = []
+        for columns, valueRows in self._valueGroups(tableSpec, rows):
+            types = None if typeMap is None else [typeMap[c] for c in columns]
+            if len(_returning) < 1:
+                self.db.copy(tableSpec['name'], columns,
+                             valueRows, binary=binary, types=types)
+                continue
+            staging, create, insert, drop = self._copyStaging(
+                tableSpec, columns, returning)
+            self.queries([create])
+            try:
+                self.db.copy(staging, columns, valueRows,
+                             binary=binary, types=types)
+                res += self.queries([insert])
+            finally:
+                self.queries([drop])
+
+        return itertools.chain(*res)
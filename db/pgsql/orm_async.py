@@ -1,14 +1,49 @@
+import ramda as R
 
 from .db import DB
 
 from ..orm_async import ORM as ORM0
+from .ormqueries import ORMQueries
 from .pipes import Pipes
 from .util import Util
 
 
-class ORM(ORM0):
+class ORM(ORMQueries, ORM0):
 
     __DEBUG__ = False
 
     def __init__(self, db: DB):
-        super().__init__(db, Util(), Pipes())
+        util = Util()
+        super().__init__(db, util, Pipes(util))
+
+    def queries(self, args):
+        args = list(args)
+        if not self.db.pipelineMode or len(args) < 2:
+            return super().queries(args)
+        return self.db.queryPipeline(args)
+
+    async def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode not in self.copyModes:
+            return await super()._insertRows(tableSpec, rows, returning=returning, batchSize=batchSize, mode=mode)
+
+        binary = self.copyModes[mode]
+        typeMap = await self.db.columnTypes(tableSpec['name']) if binary else None
+        _returning = self.prepareReturning(tableSpec, returning)
+        res = []
+        for columns, valueRows in self._valueGroups(tableSpec, rows):
+            types = None if typeMap is None else [typeMap[c] for c in columns]
+            if len(_returning) < 1:
+                await self.db.copy(tableSpec['name'], columns,
+                                   valueRows, binary=binary, types=types)
+                continue
+            staging, create, insert, drop = self._copyStaging(
+                tableSpec, columns, returning)
+            await self.queries([create])
+            try:
+                await self.db.copy(staging, columns, valueRows,
+                                   binary=binary, types=types)
+                res += await self.queries([insert])
+            finally:
+                await self.queries([drop])
+
+        return R.unnest(res)
@@ -0,0 +1,35 @@
+from uuid import uuid4
+
+try:
+    from psycopg.types.json import Jsonb
+except Exception as e:
+    Jsonb = 'Error: psycopg: ' + str(e)
+
+
+def jsonbTransform(val, inverse=False):
+    # psycopg parses json columns itself, values only need wrapping on the way in.
+    return val if inverse or val is None else Jsonb(val)
+
+
+class ORMQueries:
+
+    copyModes = {'copy': False, 'copybinary': True}
+
+    nativeTypes = {
+        'bool': None, 'int': None, 'float': None, 'str': None, 'bytes': None,
+        'date': None, 'datetime': None, 'json': jsonbTransform,
+    }
+
+    def _copyStaging(self, tableSpec, columns, returning):
+        staging = '_copy_' + uuid4().hex
+        table = self.util.quote(tableSpec['name'])
+        _columns = ', '.join(self.util.quote(columns))
+        q = 'CREATE TEMP TABLE {} AS SELECT {} FROM {} WITH NO DATA'.format(
+            self.util.quote(staging), _columns, table)
+        create = ((q, {}), {})
+        q = 'INSERT INTO {} ({}) SELECT {} FROM {}'.format(
+            table, _columns, _columns, self.util.quote(staging))
+        insert = (self._returning(tableSpec, (q, {}, self.compile(tableSpec).TMap), returning), {})
+        q = 'DROP TABLE IF EXISTS {}'.format(self.util.quote(staging))
+        drop = ((q, {}), {})
+        return staging, create, insert, drop
@@ -3,9 +3,8 @@ from .util import Util
 
 class Pipes(Pipes0):
 
-    def __init__(self):
-        util = Util()
-        super().__init__(util)
+    def __init__(self, util=None):
+        super().__init__(util if util is not None else Util())
 
     def matches(self, qpT, map=None, quote=True, *args, **kwargs):
         return self.equals(qpT, map=map, quote=quote, op='~', *args, **kwargs)
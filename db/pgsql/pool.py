@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+try:
+    from psycopg_pool import ConnectionPool
+    from psycopg_pool import AsyncConnectionPool
+except Exception as e:
+    ConnectionPool = 'Error: psycopg_pool: ' + str(e)
+    AsyncConnectionPool = ConnectionPool
+
+log0 = logging.getLogger(__name__)
+
+
+class PoolError(Exception):
+    pass
+
+
+class Pool:
+
+    def __init__(self, url, minSize=1, maxSize=10, maxLifetime=3600.0, timeout=30.0, check=True, log=None):
+        if isinstance(ConnectionPool, str):
+            raise PoolError(ConnectionPool)
+
+        self.url = url
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.maxLifetime = maxLifetime
+        self.timeout = timeout
+        self.check = check
+        self._log = log
+        self._pool = None
+        self._asyncPool = None
+
+    @property
+    def log(self):
+        return log0 if self._log is None else self._log
+
+    def _poolArgs(self, poolClass):
+        return {
+            'min_size': self.minSize,
+            'max_size': self.maxSize,
+            'max_lifetime': self.maxLifetime,
+            'timeout': self.timeout,
+            'kwargs': {'autocommit': True},
+            'check': poolClass.check_connection if self.check else None,
+        }
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self.log.debug('Opening pool %s' % self.url)
+            self._pool = ConnectionPool(
+                self.url, open=True, **self._poolArgs(ConnectionPool))
+        return self._pool
+
+    async def asyncPool(self):
+        if self._asyncPool is None:
+            self.log.debug('Opening async pool %s' % self.url)
+            pool = AsyncConnectionPool(
+                self.url, open=False, **self._poolArgs(AsyncConnectionPool))
+            await pool.open()
+            self._asyncPool = pool
+        return self._asyncPool
+
+    def getconn(self):
+        return self.pool.getconn()
+
+    def putconn(self, connection):
+        self.pool.putconn(connection)
+
+    async def agetconn(self):
+        return await (await self.asyncPool()).getconn()
+
+    async def aputconn(self, connection):
+        await (await self.asyncPool()).putconn(connection)
+
+    def aputconnSoon(self, connection):
+        # For finalizers, which cannot await.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            connection.pgconn.finish()
+            return
+        loop.create_task(self.aputconn(connection))
+
+    @property
+    def stats(self):
+        res = {}
+        for prefix, pool in (('', self._pool), ('async_', self._asyncPool)):
+            if pool is None:
+                continue
+            stats = pool.get_stats()
+            stats.setdefault('requests_num', 0)
+            stats.setdefault('requests_wait_ms', 0)
+            stats['requests_wait_ms_avg'] = stats['requests_wait_ms'] / stats['requests_num'] \
+                if stats['requests_num'] > 0 else 0.0
+            res.update({prefix + key: val for key, val in stats.items()})
+        return res
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    async def aclose(self):
+        self.close()
+        if self._asyncPool is not None:
+            await self._asyncPool.close()
+            self._asyncPool = None
@@ -0,0 +1,55 @@
+import re
+from collections import OrderedDict
+
+
+class PreparedStatements:
+
+    # Parameters as rendered by the pgsql Util, i.e. %(:name)s.
+    paramRe = re.compile(r'%\((:[^)]*?)\)s')
+
+    def __init__(self, threshold=5, maxSize=100):
+        self.threshold = threshold
+        self.maxSize = maxSize
+        self.statements = OrderedDict()
+        self.evictions = 0
+
+    @classmethod
+    def normalize(cls, q, p):
+        # Generated parameter names are unique per query, positional
+        # parameters make queries of the same shape share their text.
+        if not isinstance(p, dict):
+            return q, p
+        names = []
+
+        def replace(match):
+            names.append(match.group(1))
+            return '%s'
+
+        q = cls.paramRe.sub(replace, q)
+        return q, [p[name] for name in names]
+
+    def configure(self, connection):
+        # Every execute passes prepare explicitly, a threshold of None would
+        # disable preparing altogether.
+        connection.prepare_threshold = self.threshold
+        connection.prepared_max = self.maxSize
+
+    def prepare(self, q):
+        counters = self.statements.pop(q, None)
+        counters = {'executions': 0, 'prepared': False} if counters is None else counters
+        counters['executions'] += 1
+        counters['prepared'] = counters['executions'] >= self.threshold
+        self.statements[q] = counters
+        if len(self.statements) > self.maxSize:
+            self.statements.popitem(last=False)
+            self.evictions += 1
+        return counters['prepared']
+
+    @property
+    def stats(self):
+        return {
+            'statements': len(self.statements),
+            'prepared': len([c for c in self.statements.values() if c['prepared']]),
+            'executions': sum(c['executions'] for c in self.statements.values()),
+            'evictions': self.evictions,
+        }
@@ -8,6 +8,22 @@ class Util(Util0):
     def __init__(self):
         super().__init__('%(', ')s', '"', '%s', Util.pNamePrefix)
 
+    definitionTypeEndRe = re.compile(
+        r'\s+(?:NOT|NULL|DEFAULT|PRIMARY|REFERENCES|UNIQUE|CHECK|CONSTRAINT|COLLATE|GENERATED)\b.*$',
+        re.IGNORECASE | re.DOTALL)
+
+    serialTypes = {
+        'smallserial': 'smallint', 'serial': 'integer', 'bigserial': 'bigint',
+    }
+
+    @classmethod
+    def definitionType(cls, definition):
+        type = cls.definitionTypeEndRe.sub('', definition.strip())
+        return cls.serialTypes.get(type.lower(), type)
+
+    def cast(self, expr, definition):
+        return 'CAST({} AS {})'.format(expr, self.definitionType(definition))
+
     @classmethod
     def parseIndexName(cls, fqn):
         return re.sub(r'^(.*?.)[.](.*?)$', r'\2', fqn)
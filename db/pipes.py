@@ -84,8 +84,8 @@ class Pipes():
         return q, pp, T
 
     def any(self, qpT, pipes, cteName=None, op='UNION'):
-        cteName = cteName if cteName is not None else '_q_' + self.util.idCtr()
         q, p, T = self.util.qpTSplit(qpT)
+        cteName = cteName if cteName is not None else self.util.alias(q)
 
         if len(pipes) < 1:
             return q, p, T
@@ -95,7 +95,7 @@ class Pipes():
         for pipe in pipes:
             qq, p, T = self.util.qpTSplit(
                 self.concat((qPipeed, p), pipes=[pipe]))
-            qs.append('SELECT * FROM ({}) AS _q_{}'.format(qq, self.util.idCtr()))
+            qs.append('SELECT * FROM ({}) AS {}'.format(qq, self.util.alias(qq)))
 
         q = ['\nWITH {} AS ({})'.format(cteName, q)]
         q.append('\n{}\n'.format(op).join(qs))
@@ -0,0 +1,167 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from functools import lru_cache
+import keyword
+
+
+class RowModesError(Exception):
+    pass
+
+
+class Record:
+
+    __slots__ = ()
+
+    _fields = ()
+    _attrs = ()
+    _attrMap = {}
+
+    def __init__(self, *values):
+        for attr, value in zip(self._attrs, values):
+            object.__setattr__(self, attr, value)
+
+    @classmethod
+    def _make(cls, values):
+        return cls(*values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, self._attrMap[key])
+            except KeyError:
+                raise KeyError(key)
+        if isinstance(key, slice):
+            return tuple(self)[key]
+        return getattr(self, self._attrs[key])
+
+    def __iter__(self):
+        return (getattr(self, attr) for attr in self._attrs)
+
+    def __len__(self):
+        return len(self._attrs)
+
+    def __contains__(self, key):
+        return key in self._attrMap
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._fields == other._fields and tuple(self) == tuple(other)
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(
+            '{}={!r}'.format(name, value) for name, value in self.items()))
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return tuple(zip(self._fields, self))
+
+    def get(self, key, default=None):
+        return self[key] if key in self._attrMap else default
+
+    def _asdict(self):
+        return dict(self.items())
+
+
+class LazyRow(Mapping):
+
+    # The layout (names, index, transforms) is shared by all rows of a result.
+    __slots__ = ('_layout', '_values', '_cache')
+
+    def __init__(self, layout, values):
+        self._layout = layout
+        self._values = values
+        self._cache = {}
+
+    def __getitem__(self, key):
+        _, index, transforms = self._layout
+        try:
+            i = index[key]
+        except KeyError:
+            raise KeyError(key)
+        f = transforms[i]
+        if f is None:
+            return self._values[i]
+        if i not in self._cache:
+            self._cache[i] = f(self._values[i], True)
+        return self._cache[i]
+
+    def __iter__(self):
+        return iter(self._layout[0])
+
+    def __len__(self):
+        return len(self._layout[0])
+
+    def __contains__(self, key):
+        return key in self._layout[1]
+
+    def __repr__(self):
+        return 'LazyRow({!r})'.format(self._asdict())
+
+    def _asdict(self):
+        return dict(self.items())
+
+
+class RowModes:
+
+    DICT = 'dict'
+    TUPLE = 'tuple'
+    NAMEDTUPLE = 'namedtuple'
+    SLOTS = 'slots'
+    LAZY = 'lazy'
+
+    modes = (DICT, TUPLE, NAMEDTUPLE, SLOTS, LAZY)
+
+    @staticmethod
+    def attributeNames(names):
+        res = []
+        for i, name in enumerate(names):
+            if not name.isidentifier() or keyword.iskeyword(name) \
+                    or name.startswith('_') or hasattr(Record, name) or name in res:
+                name = '_{}'.format(i)
+            res.append(name)
+        return tuple(res)
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def recordClass(cls, names: tuple):
+        attrs = cls.attributeNames(names)
+        return type('Record', (Record,), {
+            '__slots__': attrs,
+            '_fields': names,
+            '_attrs': attrs,
+            '_attrMap': dict(zip(names, attrs)),
+        })
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def namedtupleClass(cls, names: tuple):
+        return namedtuple('Row', names, rename=True)
+
+    @classmethod
+    def factory(cls, rowMode, names, transforms=None):
+        names = tuple(names)
+        if rowMode is None or rowMode == cls.DICT:
+            return lambda values: dict(zip(names, values))
+        if rowMode == cls.TUPLE:
+            return tuple
+        if rowMode == cls.NAMEDTUPLE:
+            return cls.namedtupleClass(names)._make
+        if rowMode == cls.SLOTS:
+            return cls.recordClass(names)._make
+        if rowMode == cls.LAZY:
+            layout = (names, {name: i for i, name in enumerate(names)},
+                      [None] * len(names) if transforms is None else list(transforms))
+            return lambda values: LazyRow(layout, values)
+        raise RowModesError('Unknown row mode {}.'.format(rowMode))
+
+    @classmethod
+    def fromDict(cls, rowMode, row):
+        return cls.factory(rowMode, row.keys())(row.values())
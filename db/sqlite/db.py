@@ -1,8 +1,12 @@
-import ramda as R
 import asyncio
+import itertools
+import re
+from collections import deque
+from collections import OrderedDict
 from os import path
 from ..db import DB as DB0
 from ..db import DBError as DBError0
+from ..db import Fetcher
 from .util import Util
 from .pipes import Pipes
 from json import dumps
@@ -18,6 +22,66 @@ class DBError(DBError0):
     pass
 
 
+class CursorPool:
+
+    def __init__(self, connection, size=4):
+        self.connection = connection
+        self.size = size
+        self.idle = deque()
+        self.hits = 0
+        self.misses = 0
+        # cursors handed out and not yet released
+        self.active = 0
+
+    def acquire(self):
+        self.active += 1
+        try:
+            cursor = self.idle.pop()
+            self.hits += 1
+        except IndexError:
+            cursor = self.connection.cursor()
+            self.misses += 1
+        return cursor
+
+    def release(self, cursor):
+        self.active -= 1
+        if len(self.idle) < self.size:
+            self.idle.append(cursor)
+
+    def discard(self, cursor):
+        # Closing resets an unfinished statement, which ends its read transaction.
+        self.active -= 1
+        cursor.close()
+
+
+class StatementCacheStats:
+
+    # Mirrors the apsw statement cache (LRU on the sql text) for apsw builds
+    # lacking Connection.cache_stats.
+
+    def __init__(self, size):
+        self.size = size
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def observe(self, q):
+        if q in self.statements:
+            self.statements.move_to_end(q)
+            self.hits += 1
+            return
+        self.misses += 1
+        if self.size < 1:
+            return
+        self.statements[q] = True
+        if len(self.statements) > self.size:
+            self.statements.popitem(last=False)
+
+    @property
+    def prepares(self):
+        return self.misses
+
+
 class DB(DB0):
 
     warn_async_ctr = 1
@@ -44,7 +108,10 @@ class DB(DB0):
                  attaches={},
                  log=None,
                  busyRetries=None,
-                 busyTimeout=None
+                 busyTimeout=None,
+                 statementCacheSize=20,
+                 cursorPoolSize=4,
+                 readers=0
                  ):
 
         util = Util()
@@ -64,29 +131,35 @@ class DB(DB0):
                              'log': log,
                              'attaches': attaches,
                              'busyRetries': busyRetries,
-                             'busyTimeout': busyTimeout
+                             'busyTimeout': busyTimeout,
+                             'statementCacheSize': statementCacheSize,
+                             'cursorPoolSize': cursorPoolSize,
+                             'readers': readers
                          }),
                          log=log)
 
         self.log.info('filename: %s' % fileName)
         self._filePath = fileName
-        self.db = apsw.Connection(fileName, statementcachesize=20)
-        if busyTimeout is not None:
-            self.db.setbusytimeout(busyTimeout)
-        if busyRetries is not None:
-            self.db.setbusyhandler(lambda retries: retries <= busyRetries)
-        self.db.setbusyhandler(lambda retries: True)
-
-        self.extensions = []
+        self.statementCacheSize = statementCacheSize
+        self.busyTimeout = busyTimeout
+        self.busyRetries = busyRetries
+        self.extensions = extensions
         if len(extensions) > 0:
-            self.db.enableloadextension(True)
             self.log.info('Loading extensions is enabled!')
-            for extension in extensions:
-                print(extension)
-                self.db.loadextension(path.abspath(extension))
-
-        # self.db.execute("pragma journal_mode=WAL")
-        self.db.setrowtrace(DB.__rowFactory__)
+        self.db = self.connect()
+        self._cursorPool = CursorPool(self.db, cursorPoolSize)
+        self._statementStats = None if hasattr(self.db, 'cache_stats') \
+            else StatementCacheStats(statementCacheSize)
+
+        if readers > 0:
+            if fileName in ('', ':memory:'):
+                raise DBError('Reader connections need a database file.')
+            self.db.cursor().execute('PRAGMA journal_mode=WAL')
+        self._readers = [
+            CursorPool(self.connect(readOnly=True), cursorPoolSize) for _ in range(readers)
+        ]
+        self._nextReader = itertools.cycle(self._readers)
+        self._localNames = set()
         self._cursor = None
 
         # self.cursor.execute('PRAGMA page_size = 4096');
@@ -94,16 +167,33 @@ class DB(DB0):
         for pragma in pragmas:
             print(pragma)
             self.cursor.execute(pragma)
+            for reader in self._readers:
+                list(reader.connection.cursor().execute(pragma))
 
+        self._schemas = None
         self.attaches = {}
         for schema, filePath in attaches.items():
             self.log.info('attaching {} as {}.'.format(filePath, schema))
             self.attach(filePath, schema)
 
-    @staticmethod
-    def __rowFactory__(cursor, row):
-        columns = [t[0] for t in cursor.getdescription()]
-        return dict(zip(columns, row))
+    def connect(self, readOnly=False):
+        flags = apsw.SQLITE_OPEN_READONLY if readOnly \
+            else apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE
+        db = apsw.Connection(self._filePath, flags=flags,
+                             statementcachesize=self.statementCacheSize)
+        if self.busyTimeout is not None:
+            db.setbusytimeout(self.busyTimeout)
+        if self.busyRetries is not None:
+            db.setbusyhandler(lambda retries: retries <= self.busyRetries)
+        db.setbusyhandler(lambda retries: True)
+
+        if len(self.extensions) > 0:
+            db.enableloadextension(True)
+            for extension in self.extensions:
+                print(extension)
+                db.loadextension(path.abspath(extension))
+
+        return db
 
     def __del__(self):
         # print('Closing db!')
@@ -111,11 +201,11 @@ class DB(DB0):
         #    self.db.close()
         pass
 
-    async def async_query(self, qpT, transformer=None, stripParams=False, debug=None):
+    async def async_query(self, qpT, transformer=None, stripParams=False, debug=None, rowMode=None):
 
         def helper():
             return self.query(qpT, transformer=transformer,
-                              stripParams=stripParams, fetchAll=True, debug=debug)
+                              stripParams=stripParams, fetchAll=True, debug=debug, rowMode=rowMode)
         if self.warn_async_ctr > 0:
             self.log.warning(
                 'sqlite DB version does not support async/await and the code runs executor.')
@@ -124,21 +214,21 @@ class DB(DB0):
         return res
 
     def queryTables(self, *args, schemaRE=None, tableRE=None, pathRE=None, **kwargs):
-        schemas = R.map(lambda r: r['schema'])(self.querySchemas())
+        schemas = self.catalogSchemas()
         tableQuery = self.tableQuery(
             schemas=schemas, schemaRE=schemaRE, tableRE=tableRE, pathRE=pathRE)
         return self.query(tableQuery, *args, **kwargs)
 
     def queryColumns(self, *args, schemaRE=None, tableRE=None, columnRE=None,
                      pathRE=None, **kwargs):
-        schemas = R.map(lambda r: r['schema'])(self.querySchemas())
+        schemas = self.catalogSchemas()
         columnsQuery = self.columnQuery(schemas=schemas, schemaRE=schemaRE, tableRE=tableRE, columnRE=columnRE,
                                         pathRE=pathRE)
         return self.query(columnsQuery, *args, **kwargs)
 
     def queryIndexes(self, *args, schemaRE=None, tableRE=None, indexRE=None,
                      pathRE=None, definitionRE=None, **kwargs):
-        schemas = R.map(lambda r: r['schema'])(self.querySchemas())
+        schemas = self.catalogSchemas()
         indexQuery = self.indexQuery(schemas=schemas, schemaRE=schemaRE, tableRE=tableRE, indexRE=indexRE,
                                      pathRE=pathRE, definitionRE=definitionRE)
         return self.query(indexQuery, *args, **kwargs)
@@ -285,68 +375,205 @@ class DB(DB0):
 
         return qp
 
-    def _queryHelper(self, qpT, transformer=None, stripParams=False, debug=None):
+    readQueryRe = re.compile(r'^[\s(]*(SELECT|VALUES|WITH)\b', re.IGNORECASE)
+    writeKeywordRe = re.compile(
+        r'\b(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
 
-        def createFetchOne(_cursor):
+    @classmethod
+    def isReadQuery(cls, q):
+        match = cls.readQueryRe.match(q)
+        if match is None:
+            return False
+        return match.group(1).upper() != 'WITH' or cls.writeKeywordRe.search(q) is None
+
+    # TEMP objects only exist on the writer connection, reads that touch them
+    # can not go to the readers.
+    localDDLRe = re.compile(r'\b(TEMP|TEMPORARY|DROP|ALTER)\b', re.IGNORECASE)
+    tempSchemaRe = re.compile(r'(?<![\w$])["`\[]?temp["`\]]?\s*\.', re.IGNORECASE)
+    identifierRe = re.compile(r'"((?:[^"]|"")*)"|`([^`]*)`|\[([^\]]*)\]|([A-Za-z_][\w$]*)')
+
+    def touchesLocal(self, q):
+        if self.tempSchemaRe.search(q) is not None:
+            return True
+        if len(self._localNames) < 1:
+            return False
+        for match in self.identifierRe.finditer(q):
+            name = next(group for group in match.groups() if group is not None)
+            if name.lower() in self._localNames:
+                return True
+        return False
+
+    def _updateLocalNames(self, q):
+        if len(self._readers) < 1 or self.isReadQuery(q) or self.localDDLRe.search(q) is None:
+            return
+        cursor = self.db.cursor()
+        self._localNames = {
+            row[0].lower() for row in cursor.execute('SELECT name FROM temp.sqlite_master')}
 
-            def fetchOne():
-                return _cursor.fetchone()
+    def readsOnReader(self, q):
+        return len(self._readers) > 0 and len(self.savepoints) == 0 \
+            and self.isReadQuery(q) and not self.touchesLocal(q)
+
+    def idleReader(self):
+        # A reader still stepping a statement reads an old snapshot.
+        for _ in range(len(self._readers)):
+            reader = next(self._nextReader)
+            if reader.active < 1:
+                return reader
+        return None
+
+    def _cursorPoolFor(self, q):
+        if not self.db.getautocommit() or not self.readsOnReader(q):
+            return self._cursorPool
+        reader = self.idleReader()
+        return self._cursorPool if reader is None else reader
+
+    def _queryHelper(self, qpT, transformer=None, stripParams=False, debug=None, stream=False):
+
+        def createFetchOne(_cursor, cursorPool, description):
 
-            return fetchOne
+            released = False
+
+            def release():
+                nonlocal released
+                if not released:
+                    released = True
+                    cursorPool.release(_cursor)
+
+            def fetchEmpty():
+                release()
+
+            try:
+                names = [d[0] for d in _cursor.getdescription()]
+            except apsw.ExecutionCompleteError:
+                # An empty result keeps the names seen before the first step.
+                release()
+                return Fetcher([d[0] for d in description], fetchEmpty)
+
+            def fetchOne():
+                if released:
+                    return
+                row = _cursor.fetchone()
+                if row is None:
+                    release()
+                return row
+
+            def fetchAll():
+                if released:
+                    return []
+                rows = _cursor.fetchall()
+                release()
+                return rows
+
+            def close():
+                nonlocal released
+                if not released:
+                    released = True
+                    cursorPool.discard(_cursor)
+
+            return Fetcher(names, fetchOne, fetchAll, close=close)
 
         q, p, T = self.util.qpTSplit(qpT)
-        p = P.pStrip(q, p) if stripParams else p
+        p = self.util.pStrip(q, p) if stripParams else p
         # T = transformer if not transformer is None else Ts.transformerFactory(T, inverse=True)
         self.log.debug('q,p,T: %s, %s, %s' % (q, p, T))
 
+        if self._statementStats is not None:
+            self._statementStats.observe(q)
+
+        description = ()
+
+        def traceDescription(_cursor, *args):
+            nonlocal description
+            description = _cursor.getdescription()
+            return True
+
+        cursorPool = self._cursorPoolFor(q)
+        cursor = cursorPool.acquire()
+        cursor.setexectrace(traceDescription)
         try:
-            return createFetchOne(self.cursor.execute(q, p))
+            cursor.execute(q, p)
         except Exception as e:
+            cursor.setexectrace(None)
+            cursorPool.release(cursor)
             print(e)
             raise e
+        cursor.setexectrace(None)
+        if cursorPool is self._cursorPool:
+            self._updateLocalNames(q)
+        return createFetchOne(cursor, cursorPool, description)
+
+    def queryMany(self, qpT, paramRows, transformer=None, rowMode=None):
+        q, _, T = self.util.qpTSplit(qpT)
+        self.log.debug('q,T: %s, %s' % (q, T))
+
+        if self._statementStats is not None:
+            self._statementStats.observe(q)
+
+        names = None
+        rows = []
+        cursor = self._cursorPool.acquire()
+        try:
+            cursor.executemany(q, paramRows)
+            for row in cursor:
+                if names is None:
+                    names = [d[0] for d in cursor.getdescription()]
+                rows.append(row)
+        finally:
+            self._cursorPool.release(cursor)
+
+        if names is None:
+            return []
+        return self.createRowsT(names, T, transformer, rowMode)(rows)
 
     def attach(self, filePath, name=None):
         _name = name if name else filePath
+        if len(self._readers) > 0 and filePath in ('', ':memory:'):
+            # every reader would attach its own, empty database
+            raise DBError('Attaching with reader connections needs a database file.')
 
         # self.db.attach(filePath, _name)
-        cursor = self.db.cursor()
         q = 'ATTACH DATABASE "{}" AS "{}"'.format(filePath, _name)
         # print('q', q)
-        cursor.execute(q)
+        for db in [self.db] + [reader.connection for reader in self._readers]:
+            db.cursor().execute(q)
+        self.invalidateCatalog()
 
     def tableExists(self, tableName, columnNames):
-        sch, tbl = self.util.schemaTableSplit(tableName)
-        sch = 'main' if sch is None else sch
-
-        p = {}
-        q = '''
-        SELECT m.*, m.name as "table", p.name as "column", p.pk as "isPrimaryKey"
-        FROM `{sch}`.sqlite_master AS m
-        JOIN pragma_table_info(m.name) AS p
-        WHERE m.name = {tbl}
-        ORDER BY m.name, p.name
-        '''.format(sch=sch, tbl=self.util.p(p, tbl))
-        rows = self.query((q, p))
-        a = set([row['column'] for row in rows])
-        b = set(columnNames)
-        return a.issubset(b) and b.issubset(a)
+        return self.catalogColumns([tableName])[tableName] == set(columnNames)
 
     async def async_tableExists(self, tableName, columnNames):
-        sch, tbl = self.util.schemaTableSplit(tableName)
-        sch = 'main' if sch is None else sch
+        missing = self.catalogMissing([tableName])
+        if len(missing) > 0:
+            self.catalogUpdate(missing, await self.async_query(self.catalogQuery(missing)))
+        return self._catalog[tableName] == set(columnNames)
 
+    def catalogQuery(self, tables):
         p = {}
-        q = '''
-        SELECT m.*, m.name as "table", p.name as "column", p.pk as "isPrimaryKey"
-        FROM `{sch}`.sqlite_master AS m
-        JOIN pragma_table_info(m.name) AS p
-        WHERE m.name = {tbl}
-        ORDER BY m.name, p.name
-        '''.format(sch=sch, tbl=self.util.p(p, tbl))
-        rows = await self.async_query((q, p))
-        a = set([row['column'] for row in rows])
-        b = set(columnNames)
-        return a.issubset(b) and b.issubset(a)
+        schemaTables = {}
+        for table in tables:
+            sch, tbl = self.util.schemaTableSplit(table)
+            schemaTables.setdefault('main' if sch is None else sch, []).append(tbl)
+        qs = [
+            '''
+            SELECT {schema} AS "schema", m.name AS "table", p.name AS "column"
+            FROM `{sch}`.sqlite_master AS m
+            JOIN pragma_table_info(m.name, {schema}) AS p
+            WHERE m.name IN ({tbls})
+            '''.format(sch=sch, schema=self.util.p(p, sch), tbls=', '.join(self.util.ps(p, tbls)))
+            for sch, tbls in schemaTables.items()
+        ]
+        return ' UNION ALL '.join(qs), p
+
+    def invalidateCatalog(self, tables=None):
+        super().invalidateCatalog(tables)
+        if tables is None:
+            self._schemas = None
+
+    def catalogSchemas(self):
+        if self._schemas is None:
+            self._schemas = [row['schema'] for row in self.querySchemas()]
+        return self._schemas
 
     @classmethod
     def constantRows(cls, colTypeMap: dict, rows: tuple | list):
@@ -404,7 +631,8 @@ class DB(DB0):
                       .format(self.connection.db_filename(schema), path))
                 continue
 
-            newCon = apsw.Connection(path, statementcachesize=20)
+            newCon = apsw.Connection(
+                path, statementcachesize=self.statementCacheSize)
             with newCon.backup(schemas[0], self.connection, schemas[0]) as b:
                 while not b.done:
                     b.step(100)
@@ -415,6 +643,29 @@ class DB(DB0):
     def cursor(self):
         return self.db.cursor()
 
+    @property
+    def cacheStats(self):
+        cursorPools = [self._cursorPool] + self._readers
+        if self._statementStats is None:
+            stats = [pool.connection.cache_stats() for pool in cursorPools]
+            hits = sum(stat['hits'] for stat in stats)
+            misses = sum(stat['misses'] for stat in stats)
+            prepares = misses + sum(stat['no_cache'] for stat in stats)
+        else:
+            hits = self._statementStats.hits
+            misses = self._statementStats.misses
+            prepares = self._statementStats.prepares
+        return {
+            'statementCacheSize': self.statementCacheSize,
+            'statementHits': hits,
+            'statementMisses': misses,
+            'statementPrepares': prepares,
+            'cursorPoolSize': self._cursorPool.size,
+            'cursorHits': sum(pool.hits for pool in cursorPools),
+            'cursorMisses': sum(pool.misses for pool in cursorPools),
+            'readers': len(self._readers),
+        }
+
     @property
     def filePath(self):
         return self._filePath
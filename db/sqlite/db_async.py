@@ -1,5 +1,7 @@
 import asyncio
+import weakref
 from .db import DB as DB_sqlite
+from .writer import Writer
 
 from uuid import uuid4
 
@@ -15,18 +17,76 @@ class DB(DB_sqlite):
         from .orm_async import ORM as _SQLITEORM
         return _SQLITEORM(db)
 
-    warn_async_ctr = 1
+    def __init__(self, *args, writeBatchSize=64, **kwargs):
+        self._writer = None
+        super().__init__(*args, **kwargs)
+        self.cloneArgs[1]['writeBatchSize'] = writeBatchSize
+        self._writer = Writer(self.db, batchSize=writeBatchSize, log=self.log)
+        # The writer thread holds the connection, stop it for unclosed DBs too.
+        self._closeWriter = weakref.finalize(self, self._writer.close)
 
-    async def query(self, qpT, transformer=None, stripParams=False, debug=None):
+    @property
+    def writerStats(self):
+        return self._writer.stats
+
+    async def close(self):
+        self._closeWriter()
+
+    def _cursorPoolFor(self, q):
+        # The writer thread owns the writer connection, any other thread
+        # only runs reads that were routed to the readers.
+        if self._writer is None or self._writer.isWorkerThread or len(self._readers) < 1:
+            return self._cursorPool
+        reader = self.idleReader()
+        return next(self._nextReader) if reader is None else reader
+
+    def _usesReader(self, q):
+        return self.readsOnReader(q) and any(reader.active < 1 for reader in self._readers)
+
+    async def _run(self, q, fn, *args, reader=None):
+        if self._usesReader(q) if reader is None else reader:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        return await asyncio.wrap_future(
+            self._writer.submit(lambda: fn(*args), coalesce=Writer.isWriteQuery(q)))
+
+    async def query(self, qpT, transformer=None, stripParams=False, debug=None, rowMode=None):
 
         def helper():
             return self.sync.query(qpT, transformer=transformer,
-                                   stripParams=stripParams, fetchAll=True, debug=debug)
-        if self.warn_async_ctr > 0:
-            self.log.warning(
-                'sqlite DB does not support async/await and the code runs in executor.')
-            self.warn_async_ctr -= 1
-        return await asyncio.get_event_loop().run_in_executor(None, helper)
+                                   stripParams=stripParams, fetchAll=True, debug=debug, rowMode=rowMode)
+
+        return await self._run(self.util.qpTSplit(qpT)[0], helper)
+
+    async def stream(self, qpT, transformer=None, stripParams=False, debug=None, rowMode=None, batchSize=None):
+
+        q, p, T = self.util.qpTSplit(qpT)
+
+        def helper():
+            return self._queryHelper((q, p), None, stripParams, debug=debug)
+
+        reader = self._usesReader(q)
+        fetcher = await self._run(q, helper, reader=reader)
+        rowsT = self.createRowsT(fetcher.names, T, transformer, rowMode)
+        while True:
+            rows = await self._run(q, fetcher.fetchMany, batchSize, reader=reader)
+            if len(rows) < 1:
+                break
+            for row in rowsT(rows):
+                yield row
+
+    async def queryMany(self, qpT, paramRows, transformer=None, rowMode=None):
+
+        def helper():
+            return self.sync.queryMany(qpT, paramRows, transformer=transformer, rowMode=rowMode)
+
+        return await self._run(self.util.qpTSplit(qpT)[0], helper, reader=False)
+
+    async def queryColumnar(self, qpT, stripParams=False, numpy=False, debug=None):
+
+        def helper():
+            return self.sync.queryColumnar(qpT, stripParams=stripParams, numpy=numpy, debug=debug)
+
+        return await self._run(self.util.qpTSplit(qpT)[0], helper)
 
     async def startTransaction(self):
         self.log.debug('startTransaction (%s)' % len(self.savepoints))
@@ -41,25 +101,18 @@ class DB(DB_sqlite):
         id = self.savepoints.pop()
         await self.query(('ROLLBACK TO "{}"'.format(id)), debug=None)
         await self.query(('RELEASE "{}"'.format(id)), debug=None)
+        self.invalidateCatalog()
 
     async def commit(self):
         self.log.debug('commit (%s)' % len(self.savepoints))
         id = self.savepoints.pop()
         await self.query(('RELEASE "{}"'.format(id)), debug=None)
 
+    async def catalogColumns(self, tables):
+        missing = self.catalogMissing(tables)
+        if len(missing) > 0:
+            self.catalogUpdate(missing, await self.query(self.catalogQuery(missing)))
+        return {table: self._catalog[table] for table in tables}
+
     async def tableExists(self, tableName, columnNames):
-        sch, tbl = self.util.schemaTableSplit(tableName)
-        sch = 'main' if sch is None else sch
-
-        p = {}
-        q = '''
-        SELECT m.*, m.name as "table", p.name as "column", p.pk as "isPrimaryKey"
-        FROM `{sch}`.sqlite_master AS m
-        JOIN pragma_table_info(m.name) AS p
-        WHERE m.name = {tbl}
-        ORDER BY m.name, p.name
-        '''.format(sch=sch, tbl=self.util.p(p, tbl))
-        rows = await self.query((q, p))
-        a = set([row['column'] for row in rows])
-        b = set(columnNames)
-        return a.issubset(b) and b.issubset(a)
+        return (await self.catalogColumns([tableName]))[tableName] == set(columnNames)
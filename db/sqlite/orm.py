@@ -1,11 +1,31 @@
+import itertools
+
 from ..orm import ORM as ORM0
+from .ormqueries import ORMQueries
 from .pipes import Pipes
 from .util import Util
 
 
-class ORM(ORM0):
+class ORM(ORMQueries, ORM0):
 
     __DEBUG__ = False
 
     def __init__(self, db):
-        super().__init__(db, Util(), Pipes())
+        util = Util()
+        super().__init__(db, util, Pipes(util))
+
+    def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode != 'executemany':
+            return super()._insertRows(tableSpec, rows, returning=returning, batchSize=batchSize, mode=mode)
+
+        res = []
+        self.db.startTransaction()
+        try:
+            for qpT, paramRows in self._insertMany(tableSpec, rows, returning):
+                res.append(self.db.queryMany(qpT, paramRows))
+        except Exception as e:
+            self.db.rollback()
+            raise e
+        self.db.commit()
+
+        return itertools.chain(*res)
@@ -1,13 +1,32 @@
+import ramda as R
 
 from .db import DB
 from ..orm_async import ORM as ORM0
+from .ormqueries import ORMQueries
 from .pipes import Pipes
 from .util import Util
 
 
-class ORM(ORM0):
+class ORM(ORMQueries, ORM0):
 
     __DEBUG__ = False
 
     def __init__(self, db: DB):
-        super().__init__(db, Util(), Pipes())
+        util = Util()
+        super().__init__(db, util, Pipes(util))
+
+    async def _insertRows(self, tableSpec, rows, returning=None, batchSize=None, mode=None):
+        if mode != 'executemany':
+            return await super()._insertRows(tableSpec, rows, returning=returning, batchSize=batchSize, mode=mode)
+
+        res = []
+        await self.db.startTransaction()
+        try:
+            for qpT, paramRows in self._insertMany(tableSpec, rows, returning):
+                res.append(await self.db.queryMany(qpT, paramRows))
+        except Exception as e:
+            await self.db.rollback()
+            raise e
+        await self.db.commit()
+
+        return R.unnest(res)
@@ -0,0 +1,14 @@
+class ORMQueries:
+
+    # apsw stores these as they are, other declared types fall back to Ts.
+    nativeTypes = {'int': None, 'float': None, 'str': None, 'bytes': None}
+
+    def _insertMany(self, tableSpec, rows, returning=None):
+        TMap = self.compile(tableSpec).TMap
+        res = []
+        for columns, paramRows in self._valueGroups(tableSpec, rows):
+            q = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                self.util.quote(tableSpec['name']), ', '.join(self.util.quote(columns)),
+                ', '.join([self.ph] * len(columns)))
+            res.append((self._returning(tableSpec, (q, {}, TMap), returning), paramRows))
+        return res
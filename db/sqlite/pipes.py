@@ -3,9 +3,8 @@ from .util import Util
 
 class Pipes(Pipes0):
 
-    def __init__(self, *args, **kwargs):
-        util = Util()
-        super().__init__(util)
+    def __init__(self, util=None, *args, **kwargs):
+        super().__init__(util if util is not None else Util())
 
 
     def matches(self, qpT, map=None, quote=True, *args, **kwargs):
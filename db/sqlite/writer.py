@@ -0,0 +1,157 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from uuid import uuid4
+
+log0 = logging.getLogger(__name__)
+
+
+class Writer:
+
+    writeQueryRe = re.compile(
+        r'^[\s(]*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+    @classmethod
+    def isWriteQuery(cls, q):
+        return cls.writeQueryRe.match(q) is not None
+
+    def __init__(self, connection, batchSize=64, log=None):
+        self.connection = connection
+        self.batchSize = batchSize
+        self._log = log
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.maxDepth = 0
+        self.waitSeconds = 0.0
+        self.execSeconds = 0.0
+
+    @property
+    def log(self):
+        return log0 if self._log is None else self._log
+
+    @property
+    def isWorkerThread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, fn, coalesce=False):
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((fn, future, coalesce, time.perf_counter()))
+            self.maxDepth = max(self.maxDepth, self._queue.qsize())
+        return future
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    @property
+    def stats(self):
+        done = max(self.requests, 1)
+        return {
+            'queueDepth': self._queue.qsize(),
+            'maxQueueDepth': self.maxDepth,
+            'requests': self.requests,
+            'batches': self.batches,
+            'coalesced': self.coalesced,
+            'waitMsAvg': 1000 * self.waitSeconds / done,
+            'execMsAvg': 1000 * self.execSeconds / done,
+        }
+
+    def _run(self):
+        pending = None
+        while True:
+            item = self._queue.get() if pending is None else pending
+            pending = None
+            if item is None:
+                return
+
+            batch = [item]
+            if item[2] and self.connection.getautocommit():
+                while len(batch) < self.batchSize:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None or not item[2]:
+                        pending = item
+                        break
+                    batch.append(item)
+
+            if len(batch) > 1:
+                self._runBatch(batch)
+            else:
+                self._runOne(batch[0])
+            # do not keep the last request, and what it refers to, alive
+            batch = item = None
+
+    def _started(self, item):
+        start = time.perf_counter()
+        self.requests += 1
+        self.waitSeconds += start - item[3]
+        return start
+
+    def _runOne(self, item):
+        fn, future, _, _ = item
+        start = self._started(item)
+        self.batches += 1
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self.execSeconds += time.perf_counter() - start
+
+    def _runBatch(self, batch):
+        # Coalesced writes share one transaction, each in its own savepoint
+        # so that a failing statement only fails its own request.
+        self.log.debug('coalescing %s writes' % len(batch))
+        self.batches += 1
+        self.coalesced += len(batch)
+        cursor = self.connection.cursor()
+        outer = str(uuid4())
+        cursor.execute('SAVEPOINT "{}"'.format(outer))
+        outcomes = []
+        for item in batch:
+            fn, future, _, _ = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = self._started(item)
+            inner = str(uuid4())
+            cursor.execute('SAVEPOINT "{}"'.format(inner))
+            try:
+                outcomes.append((future, fn(), None))
+            except BaseException as e:
+                cursor.execute('ROLLBACK TO "{}"'.format(inner))
+                outcomes.append((future, None, e))
+            cursor.execute('RELEASE "{}"'.format(inner))
+            self.execSeconds += time.perf_counter() - start
+        try:
+            cursor.execute('RELEASE "{}"'.format(outer))
+        except BaseException as e:
+            cursor.execute('ROLLBACK TO "{}"'.format(outer))
+            cursor.execute('RELEASE "{}"'.format(outer))
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+
+        for future, result, e in outcomes:
+            if e is None:
+                future.set_result(result)
+            else:
+                future.set_exception(e)
@@ -1,15 +1,63 @@
+from datetime import date
 from datetime import datetime
+import json
+import math
+import struct
 import jsonpickle
 import dill
 
+try:
+    import numpy as np
+except Exception as e:
+    np = 'Error: numpy: ' + str(e)
+
+try:
+    import orjson
+    orjsonOptions = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS \
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+except Exception as e:
+    orjson = 'Error: orjson: ' + str(e)
+    orjsonOptions = None
+
+jsonPickleMarker = '"py/'
+
+# Magic, dtype length, ndim, dtype, then one int64 per dimension.
+npBufferMagic = b'\x93NDB'
+# magic, dtype length, ndim and the offset of the data
+npBufferHead = struct.Struct('<4sBBH')
+npBufferAlign = 16
+
+
+class TsError(Exception):
+    pass
+
+
+def refuseJSON(val):
+    raise TypeError('{} is not plain JSON.'.format(type(val).__name__))
+
+
+def hasNonFinite(val):
+    if isinstance(val, float):
+        return not math.isfinite(val)
+    if isinstance(val, dict):
+        return any(hasNonFinite(item) for item in val.values())
+    if isinstance(val, (list, tuple)):
+        return any(hasNonFinite(item) for item in val)
+    return False
+
+
+def identityRowTransform(row, *args, **kwargs):
+    return row
+
 
 class Ts:
 
     class RowTransformer(dict):
-        def __init__(self, *args, rowTransform=lambda row, *args, **kwargs: row, **kwargs):
+        def __init__(self, *args, rowTransform=identityRowTransform, rowMode=None, **kwargs):
             super().__init__(*args, **kwargs)
 
             self._rowTransform = rowTransform
+            self.rowMode = rowMode
 
         def __call__(self, row, inverse, *args, **kwargs):
             try:
@@ -38,15 +86,29 @@ class Ts:
         def rowTransform(self):
             self._rowTransform = None
 
+        @property
+        def hasRowTransform(self):
+            return callable(self._rowTransform) \
+                and self._rowTransform is not identityRowTransform
+
+        def columnTransforms(self, names):
+            return [(i, self[name]) for i, name in enumerate(names) if name in self]
+
         def chainRowTransform(self, rowTransform):
 
             rowTransform0 = self.rowTransform
+            # Chains are kept flat, one loop instead of a closure per link.
+            rowTransforms = [
+                f for f in getattr(rowTransform0, 'rowTransforms', [rowTransform0])
+                if callable(f) and f is not identityRowTransform
+            ] + [rowTransform]
 
             def chainedRowTransform(row, inverse, *args, **kwargs):
-                res = rowTransform0(row, inverse, *args, **kwargs)
-                res = rowTransform(res, inverse, *args, **kwargs)
-                return res
+                for f in rowTransforms:
+                    row = f(row, inverse, *args, **kwargs)
+                return row
 
+            chainedRowTransform.rowTransforms = rowTransforms
             self.rowTransform = chainedRowTransform
 
     def transformerFactory(transformMap, inverse=False):
@@ -105,6 +167,55 @@ class Ts:
 
         return jsonpickle.dumps(val)
 
+    def dumpsJSON(val):
+        # Plain payloads skip jsonpickle, anything else falls back to it.
+        try:
+            if isinstance(orjson, str):
+                return json.dumps(val, default=refuseJSON, separators=(',', ':'))
+            res = orjson.dumps(val, default=refuseJSON, option=orjsonOptions)
+            # orjson writes NaN and Infinity as null, the stdlib keeps them.
+            if b'null' in res and hasNonFinite(val):
+                return json.dumps(val, default=refuseJSON, separators=(',', ':'))
+            return res.decode()
+        except (TypeError, ValueError):
+            return jsonpickle.dumps(val)
+
+    def loadsJSON(val):
+        if isinstance(val, (bytes, bytearray, memoryview)):
+            val = bytes(val).decode()
+        if jsonPickleMarker in val:
+            return jsonpickle.loads(val)
+        if isinstance(orjson, str):
+            return json.loads(val)
+        try:
+            return orjson.loads(val)
+        except orjson.JSONDecodeError:
+            # NaN and Infinity are only read by the stdlib
+            return json.loads(val)
+
+    def fastJSON(val, inverse=False):
+        if inverse:
+            return Ts.loadsJSON(val)
+
+        return Ts.dumpsJSON(val)
+
+    def nullableFastJSON(val, inverse=False):
+        if inverse:
+            return val if val is None else Ts.loadsJSON(val)
+
+        return Ts.dumpsJSON(val)
+
+    def fastListTCreator(T):
+
+        def helper(val: list, inverse=False):
+
+            if inverse:
+                return [T(item, inverse) for item in Ts.loadsJSON(val)]
+
+            return Ts.dumpsJSON([T(item) for item in val])
+
+        return helper
+
     def dateAsStr(val, inverse=False):
         if inverse:
             return datetime.strptime(val, '%Y-%m-%d')
@@ -137,6 +248,22 @@ class Ts:
         dt = datetime.fromisoformat(val) if isinstance(val, str) else val
         return dt.isoformat()
 
+    def isoDate(val, inverse=False):
+        if val is None:
+            return None
+        if inverse:
+            return date.fromisoformat(val)
+
+        return val if isinstance(val, str) else val.isoformat()
+
+    def isoDateTime(val, inverse=False):
+        if val is None:
+            return None
+        if inverse:
+            return datetime.fromisoformat(val)
+
+        return val if isinstance(val, str) else val.isoformat()
+
     def nullableDateTimeAsStr(val, inverse=False):
         if inverse:
             if val != '':
@@ -167,6 +294,41 @@ class Ts:
         res = jsonpickle.encode(val)
         return res
 
+    def npArrayAsBuffer(val, inverse=False):
+        if val is None:
+            return None
+        if isinstance(np, str):
+            raise TsError(np)
+
+        if inverse:
+            buffer = memoryview(val)
+            magic, dtypeSize, ndim, dataOffset = npBufferHead.unpack_from(buffer)
+            if magic != npBufferMagic:
+                raise TsError('Not an ndarray buffer.')
+            offset = npBufferHead.size
+            dtype = np.dtype(bytes(buffer[offset:offset + dtypeSize]).decode())
+            offset += dtypeSize
+            shape = struct.unpack_from('<{}q'.format(ndim), buffer, offset)
+            # A read only view over the fetched bytes, nothing is copied.
+            return np.frombuffer(buffer, dtype=dtype, offset=dataOffset).reshape(shape)
+
+        val = np.asarray(val)
+        if val.dtype.hasobject:
+            raise TsError('Object arrays have no raw buffer.')
+        if val.dtype.names is not None:
+            # dtype.str of a structured dtype is a bare '|V..' without its fields.
+            raise TsError('Structured arrays have no raw buffer.')
+        dtype = val.dtype.str.encode()
+        # The header is padded, so that the data stays aligned for frombuffer.
+        size = npBufferHead.size + len(dtype) + 8 * val.ndim
+        dataOffset = -(-size // npBufferAlign) * npBufferAlign
+        return b''.join([
+            npBufferHead.pack(npBufferMagic, len(dtype), val.ndim, dataOffset), dtype,
+            struct.pack('<{}q'.format(val.ndim), *val.shape),
+            bytes(dataOffset - size),
+            np.ascontiguousarray(val).tobytes(),
+        ])
+
     # def Class(val, inverse=False):
     #    if inverse:
     #        res = dill.load(val)
@@ -193,3 +355,16 @@ class Ts:
             return res
         res = dill.dumps(val)
         return res
+
+    # Fallbacks for declared column types a driver does not convert itself.
+    typeTransforms = {
+        'bool': nullable(boolAsInt, lambda val: val is None),
+        'int': None,
+        'float': None,
+        'str': None,
+        'bytes': None,
+        'date': isoDate,
+        'datetime': isoDateTime,
+        'json': nullableFastJSON,
+        'ndarray': npArrayAsBuffer,
+    }
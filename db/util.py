@@ -103,8 +103,34 @@ class Util():
 
         return self.quoteRe.sub(replace, expr)
 
+    # Opt in to name parameters by their position in p, so that queries
+    # of the same shape render the same text. Only safe when parameter
+    # dicts are built up incrementally, never merged side by side.
+    stableParams = False
+
+    def stableName(self, p):
+        i = len(p)
+        name = '{}p{}'.format(self.pNamePrefix, i)
+        while name in p:
+            i += 1
+            name = '{}p{}'.format(self.pNamePrefix, i)
+        return name
+
+    def alias(self, q, prefix='_q_'):
+        # Stable aliases only have to differ from the names already in q.
+        if not self.stableParams:
+            return prefix + self.idCtr()
+        i = 1
+        while '{}{}'.format(prefix, i) in q:
+            i += 1
+        return '{}{}'.format(prefix, i)
+
     def p(self, p, val, name='', prefix='', suffix=''):
-        name = str(self.pNamePrefix) + self.nextUniq(name, self._pId, str)
+        if self.stableParams:
+            name = self.stableName(p)
+        else:
+            name = str(self.pNamePrefix) + \
+                self.nextUniq(name, self._pId, '_')
         p[name] = val
         return self.prefix + prefix + name + suffix + self.suffix
 
@@ -114,6 +140,9 @@ class Util():
             names.append(self.p(p, val, name=str(key)))
         return names if sep == None else sep.join(names)
 
+    def cast(self, expr, definition):
+        return expr
+
     def pStrip(self, q, p):
 
         pNames = self.pRe.findall(q)
@@ -1,3 +1,4 @@
+import gc
 import unittest
 import testing.postgresql
 
@@ -8,6 +9,7 @@ from db.pgsql.util import Util
 from db.ts import Ts
 from db.pgsql.orm_async import ORM
 from db.pgsql.pipes import Pipes
+from db.pgsql.pool import Pool
 
 
 class TestAsyncDB(unittest.IsolatedAsyncioTestCase):
@@ -567,6 +569,273 @@ class TestAsyncDB(unittest.IsolatedAsyncioTestCase):
             assert rows[3]['isInDB']
 
 
+    async def test_stream(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "streamed",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            await orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ])
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            rows = [row async for row in orm.stream(qpT, batchSize=2)]
+            self.assertEqual([
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ], rows)
+
+            rows = [row async for row in db.stream(qpT, rowMode='tuple')]
+            self.assertEqual([(i, i % 2 == 0) for i in range(5)], rows)
+
+            streams = "SELECT count(*) AS n FROM pg_stat_activity WHERE state = 'idle in transaction'"
+            rows = db.stream(qpT, batchSize=2)
+            await rows.__anext__()
+            await db.query('INSERT INTO "streamed" ("id") VALUES (5)')
+            self.assertEqual([{'n': 1}], await db.query(streams))
+            self.assertEqual(4, len([row async for row in rows]))
+            self.assertEqual(6, len(await db.query(orm.select(tableSpec))))
+
+            rows = db.stream(qpT, batchSize=2)
+            await rows.__anext__()
+            await rows.aclose()
+            self.assertEqual([{'n': 0}], await db.query(streams))
+
+
+    async def test_del_closes(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            connection = await db.async_db
+            del db
+            gc.collect()
+            self.assertTrue(connection.closed)
+
+    async def test_ensure_tables(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            await db.query('CREATE SCHEMA "other"')
+            tableSpecs = [{
+                'name': name,
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", },
+                },
+                'primaryKeys': ["id"]
+            } for name in ('ensured', 'other.ensured')]
+
+            self.assertEqual([True, True], await orm.ensureTables(tableSpecs))
+            self.assertEqual([False, False], await orm.ensureTables(tableSpecs))
+            # the unqualified name is the one on the search_path
+            self.assertEqual({'ensured': {'id'}, 'other.ensured': {'id'}, 'other.missing': set()},
+                             await db.catalogColumns(['ensured', 'other.ensured', 'other.missing']))
+            await orm.insert(tableSpecs[1], [{'id': 'a'}])
+            self.assertEqual([], await db.query(orm.select(tableSpecs[0])))
+            self.assertEqual([{'id': 'a'}], await db.query(orm.select(tableSpecs[1])))
+
+            # DDL through the ORM invalidates the cached entries
+            await orm.dropTable(tableSpecs[1])
+            self.assertFalse(await orm.tableExists(tableSpecs[1]))
+            self.assertTrue(await orm.tableExists(tableSpecs[0]))
+            await orm.dropTable(tableSpecs[0])
+            self.assertEqual({'ensured': set()}, await db.catalogColumns(['ensured']))
+            self.assertEqual([True, True], await orm.ensureTables(tableSpecs))
+
+    async def test_pool(self):
+        with testing.postgresql.Postgresql() as testpg:
+            pool = Pool(testpg.url(), minSize=1, maxSize=2)
+            db = DB(testpg.url(), pool=pool)
+            await db.query('CREATE TABLE pooled (id INT PRIMARY KEY)')
+            await db.query('INSERT INTO pooled (id) VALUES (1)')
+            self.assertEqual([{'id': 1}], await db.query('SELECT * FROM pooled'))
+            self.assertEqual(1, pool.stats['async_requests_num'])
+
+            await db.close()
+            self.assertGreaterEqual(pool.stats['async_pool_available'], 1)
+            await pool.aclose()
+
+    async def test_copy_insert(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "copied",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            await orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(3)
+            ], mode='copy')
+            rows = await orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(3, 5)
+            ], mode='copybinary', returning=['id', 'verified'])
+            self.assertEqual([{'id': 3, 'verified': False}, {'id': 4, 'verified': True}],
+                             sorted(rows, key=lambda r: r['id']))
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual([
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ], await db.query(qpT))
+            await db.close()
+
+    async def test_onconflict_upsert(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "upserted",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            await orm.insert(tableSpec, [{'id': 1, 'verified': False}])
+            rows = await orm.upsert(tableSpec, [
+                {'id': 1, 'verified': True}, {'id': 2, 'verified': False},
+            ], mode='onconflict', returning=['id', 'verified'])
+            self.assertEqual([{'id': 1, 'verified': True}, {'id': 2, 'verified': False}], rows)
+            self.assertEqual([], await orm.upsert(tableSpec, [{'id': 3}], mode='onconflict'))
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual([
+                {'id': 1, 'verified': True}, {'id': 2, 'verified': False}, {'id': 3, 'verified': False},
+            ], await db.query(qpT))
+            await db.close()
+
+    async def test_batch_update(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "updated",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'day': {'definition': "DATE", },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            await orm.insert(tableSpec, [{'id': 1}, {'id': 2}])
+            rows = await orm.update(tableSpec, [
+                {'id': 2, 'day': '2020-01-02'}, {'id': 3, 'day': '2020-01-03'},
+                {'id': 1, 'day': '2020-01-01'},
+            ], mode='batch', returning=['id', 'day'])
+            self.assertEqual(['2020-01-02', None, '2020-01-01'],
+                             [None if row is None else str(row['day']) for row in rows])
+            await db.close()
+
+    async def test_keys_delete(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "deleted",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            await orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ])
+            rows = await orm.delete(tableSpec, [{'id': 1}, {'id': 4}, {'id': 7}], mode='keys')
+            self.assertEqual([{'id': 1, 'verified': False}, {'id': 4, 'verified': True}],
+                             sorted(rows, key=lambda r: r['id']))
+            self.assertEqual([0, 2, 3], [row['id'] for row in await db.query(
+                Pipes().order(orm.select(tableSpec), ['id']))])
+            await db.close()
+
+    async def test_pipeline(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url(), pipelineMode=True)
+            orm = ORM(db)
+            tableSpec = {
+                'name': "pipelined",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+            rows = await orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(7)
+            ], batchSize=3, returning=['id'])
+            self.assertEqual([{'id': i} for i in range(7)], rows)
+
+            rows = await orm.update(tableSpec, [
+                {'id': 5, 'verified': True}, {'id': 5, 'verified': False}, {'id': 9, 'verified': True},
+            ], mode='batch', returning=['verified'])
+            self.assertEqual([{'verified': True}, {'verified': False}, None], rows)
+
+            rows = await orm.delete(tableSpec, [{'id': i} for i in range(0, 7, 2)],
+                                    mode='keys', batchSize=2)
+            self.assertEqual([0, 2, 4, 6], [row['id'] for row in rows])
+
+            res = await db.queryPipeline([
+                (('SELECT 1 AS n', []), {}),
+                (('UPDATE "pipelined" SET "verified" = 1', []), {}),
+                (orm.select(tableSpec), {'rowMode': 'tuple'}),
+            ])
+            self.assertEqual([{'n': 1}], res[0])
+            self.assertEqual([(1, True), (3, True), (5, True)], sorted(res[2]))
+            await db.close()
+
+    async def test_prepared(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url(), prepareThreshold=2)
+            for i in range(3):
+                p = {}
+                q = 'SELECT {} AS n'.format(db.util.p(p, i))
+                self.assertEqual([{'n': i}], await db.query((q, p)))
+            self.assertEqual({'statements': 1, 'prepared': 1, 'executions': 3, 'evictions': 0},
+                             db.preparedStats)
+            rows = await db.query('SELECT count(*) AS n FROM pg_prepared_statements')
+            self.assertEqual([{'n': 1}], rows)
+            await db.close()
+
+    async def test_streamed_insert(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "streamedin",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            await orm.createTable(tableSpec)
+
+            async def rows(n, verified):
+                for i in range(n):
+                    yield {'id': i, 'verified': verified}
+
+            await orm.insert(tableSpec, rows(5, False), batchSize=2, mode='copybinary')
+            res = await orm.upsert(tableSpec, rows(7, True), batchSize=3,
+                                   returning=['id'], mode='onconflict')
+            self.assertEqual([{'id': i} for i in range(7)], list(res))
+
+            rows = await db.query(Pipes().order(orm.select(tableSpec), ['id']))
+            self.assertEqual([{'id': i, 'verified': True} for i in range(7)], rows)
+            await db.close()
+
+
 if __name__ == '__main__':
 
     unittest.main()
@@ -1,13 +1,18 @@
 import unittest
 import testing.postgresql
+from array import array
 
 from collections import OrderedDict
+from datetime import date
+from datetime import datetime
 
 from db.pgsql.db import DB
+from db.pgsql.db import PipelineError
 from db.pgsql.util import Util
 from db.ts import Ts
 from db.pgsql.orm import ORM
 from db.pgsql.pipes import Pipes
+from db.pgsql.pool import Pool
 
 
 class TestDB(unittest.TestCase):
@@ -805,6 +810,470 @@ class TestDB(unittest.TestCase):
                 'TextString': None, 'Float1': None, 'FloatString': None
             }, actRows[3])
 
+    def test_row_modes(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "modes",
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                    'x y': {'definition': "DOUBLE PRECISION", },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [
+                {'id': '111', 'verified': True, 'x y': 1.5},
+            ])
+
+            rows = db.query(orm.select(tableSpec), fetchAll=True)
+            self.assertEqual(
+                [{'id': '111', 'verified': True, 'x y': 1.5}], rows)
+
+            rows = db.query(orm.select(tableSpec),
+                            fetchAll=True, rowMode='tuple')
+            self.assertEqual([('111', True, 1.5)], rows)
+
+            rows = db.query(orm.select(tableSpec),
+                            fetchAll=True, rowMode='namedtuple')
+            self.assertEqual('111', rows[0].id)
+
+            rows = db.query(orm.select(
+                tableSpec, rowMode='slots'), fetchAll=True)
+            self.assertEqual('111', rows[0].id)
+            self.assertEqual(1.5, rows[0]['x y'])
+            self.assertEqual(
+                {'id': '111', 'verified': True, 'x y': 1.5}, rows[0])
+
+    def test_query_columnar(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "columnar",
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'n': {'definition': "BIGINT", },
+                    'x': {'definition': "DOUBLE PRECISION", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [
+                {'id': '111', 'n': 1, 'x': 1.5, 'verified': True},
+                {'id': '222', 'n': 2, 'x': 2, 'verified': False},
+            ])
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            columns = db.queryColumnar(qpT)
+            self.assertEqual(['111', '222'], columns['id'])
+            self.assertEqual([True, False], columns['verified'])
+            self.assertEqual(array('q', [1, 2]), columns['n'])
+            self.assertEqual(array('d', [1.5, 2.0]), columns['x'])
+
+            columns = db.queryColumnar('SELECT * FROM columnar WHERE false')
+            self.assertEqual([], columns['id'])
+
+    def test_stream(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url(), itersize=2)
+            orm = ORM(db)
+            tableSpec = {
+                'name': "streamed",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ])
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            rows = db.query(qpT, stream=True)
+            self.assertEqual({'id': 0, 'verified': True}, next(rows))
+            rows = [{'id': 0, 'verified': True}] + list(rows)
+            self.assertEqual([
+                {'id': i, 'verified': i % 2 == 0} for i in range(5)
+            ], rows)
+
+            db.startTransaction()
+            rows = list(db.query(qpT, stream=True, rowMode='tuple'))
+            db.commit()
+            self.assertEqual([(i, i % 2 == 0) for i in range(5)], rows)
+
+            # a stream has a connection of its own, queries next to it commit
+            # as usual
+            streams = "SELECT count(*) AS n FROM pg_stat_activity WHERE state = 'idle in transaction'"
+            rows = db.query(qpT, stream=True)
+            next(rows)
+            db.query('INSERT INTO "streamed" ("id") VALUES (5)')
+            db.startTransaction()
+            db.startTransaction()
+            db.query('INSERT INTO "streamed" ("id") VALUES (6)')
+            db.commit()
+            db.commit()
+            other = DB(testpg.url())
+            self.assertEqual(7, len(other.query(orm.select(tableSpec), fetchAll=True)))
+            self.assertEqual([{'n': 1}], other.query(streams, fetchAll=True))
+            self.assertEqual(4, len(list(rows)))
+
+            # stopping early closes the cursor and its transaction
+            rows = db.query(qpT, stream=True)
+            next(rows)
+            rows.close()
+            self.assertEqual([{'n': 0}], other.query(streams, fetchAll=True))
+            other.close()
+
+
+    def test_ensure_tables(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            db.query('CREATE SCHEMA "other"')
+            tableSpecs = [{
+                'name': name,
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", },
+                },
+                'primaryKeys': ["id"]
+            } for name in ('ensured', 'other.ensured')]
+
+            self.assertEqual([True, True], orm.ensureTables(tableSpecs))
+            self.assertEqual([False, False], orm.ensureTables(tableSpecs))
+            # the unqualified name is the one on the search_path
+            self.assertEqual({'ensured': {'id'}, 'other.ensured': {'id'}, 'other.missing': set()},
+                             db.catalogColumns(['ensured', 'other.ensured', 'other.missing']))
+            orm.insert(tableSpecs[1], [{'id': 'a'}])
+            self.assertEqual([], db.query(orm.select(tableSpecs[0]), fetchAll=True))
+            self.assertEqual([{'id': 'a'}], db.query(orm.select(tableSpecs[1]), fetchAll=True))
+
+            # DDL through the ORM invalidates the cached entries
+            orm.dropTable(tableSpecs[1])
+            self.assertFalse(orm.tableExists(tableSpecs[1]))
+            self.assertTrue(orm.tableExists(tableSpecs[0]))
+            orm.dropTable(tableSpecs[0])
+            self.assertEqual({'ensured': set()}, db.catalogColumns(['ensured']))
+            self.assertEqual([True, True], orm.ensureTables(tableSpecs))
+
+    def test_pool(self):
+        with testing.postgresql.Postgresql() as testpg:
+            pool = Pool(testpg.url(), minSize=1, maxSize=2)
+            db = DB(testpg.url(), pool=pool)
+            db.query('CREATE TABLE pooled (id INT PRIMARY KEY)')
+            db.query('INSERT INTO pooled (id) VALUES (1)')
+
+            clone = db.clone()
+            self.assertIs(pool, clone.pool)
+            self.assertEqual([{'id': 1}], clone.query(
+                'SELECT * FROM pooled', fetchAll=True))
+
+            stats = pool.stats
+            self.assertEqual(2, stats['pool_size'])
+            self.assertEqual(2, stats['requests_num'])
+            self.assertIn('requests_wait_ms_avg', stats)
+
+            clone.close()
+            self.assertEqual(1, pool.stats['pool_available'])
+            db.close()
+            pool.close()
+
+    def test_copy_insert(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+
+            def rowTransform(row, inverse):
+                res = {**row}
+                if inverse:
+                    res['isInDB'] = True
+                else:
+                    res.pop('isInDB', None)
+                return res
+
+            tableSpec = {
+                'name': "copied",
+                'rowTransform': rowTransform,
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                    'x': {'definition': "DOUBLE PRECISION", },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+
+            res = orm.insert(tableSpec, [
+                {'id': '111', 'verified': True, 'x': 1.5, 'isInDB': False},
+                {'id': '222', 'verified': False, 'isInDB': False},
+            ], mode='copy', fetchAll=True)
+            self.assertEqual([], res)
+
+            rows = orm.insert(tableSpec, [
+                {'id': '333', 'verified': True, 'x': 3.5, 'isInDB': False},
+                {'id': '444', 'verified': False, 'x': 4, 'isInDB': False},
+            ], mode='copybinary', returning=['id', 'verified'], fetchAll=True)
+            self.assertEqual([
+                {'id': '333', 'verified': True, 'isInDB': True},
+                {'id': '444', 'verified': False, 'isInDB': True},
+            ], sorted(rows, key=lambda r: r['id']))
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual([
+                {'id': '111', 'verified': True, 'x': 1.5, 'isInDB': True},
+                {'id': '222', 'verified': False, 'x': None, 'isInDB': True},
+                {'id': '333', 'verified': True, 'x': 3.5, 'isInDB': True},
+                {'id': '444', 'verified': False, 'x': 4.0, 'isInDB': True},
+            ], db.query(qpT, fetchAll=True))
+            self.assertEqual(0, len(db.query(
+                "SELECT * FROM pg_tables WHERE tablename LIKE '\\_copy\\_%'", fetchAll=True)))
+
+    def test_onconflict_upsert(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "upserted",
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'n': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id", "n"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [{'id': 'a', 'n': 1, 'verified': False}])
+
+            rows = orm.upsert(tableSpec, [
+                {'id': 'a', 'n': 1, 'verified': True},
+                {'id': 'b', 'n': 1, 'verified': False},
+                {'id': 'b', 'n': 1, 'verified': True},
+                {'id': 'c', 'n': 2},
+            ], mode='onconflict', batchSize=2, returning=['id', 'n', 'verified'], fetchAll=True)
+            self.assertEqual([
+                {'id': 'a', 'n': 1, 'verified': True},
+                {'id': 'b', 'n': 1, 'verified': False},
+                {'id': 'b', 'n': 1, 'verified': True},
+                {'id': 'c', 'n': 2, 'verified': False},
+            ], rows)
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual([
+                {'id': 'a', 'n': 1, 'verified': True},
+                {'id': 'b', 'n': 1, 'verified': True},
+                {'id': 'c', 'n': 2, 'verified': False},
+            ], db.query(qpT, fetchAll=True))
+
+    def test_pipeline(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url(), pipelineMode=True)
+            orm = ORM(db)
+            tableSpec = {
+                'name': "pipelined",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [{'id': i} for i in range(0, 6, 2)])
+            rows = orm.upsert(tableSpec, [
+                {'id': i, 'verified': i % 3 == 0} for i in range(6)
+            ], batchSize=2, returning=['id', 'verified'])
+            self.assertEqual([(i, i % 3 == 0) for i in range(6)],
+                             sorted((row['id'], row['verified']) for row in rows))
+
+            with self.assertRaises(PipelineError) as cm:
+                db.queryPipeline([
+                    (('INSERT INTO "pipelined" ("id") VALUES (10)', []), {}),
+                    (('INSERT INTO "pipelined" ("id") VALUES (0)', []), {}),
+                    (('INSERT INTO "pipelined" ("id") VALUES (11)', []), {}),
+                ])
+            self.assertEqual(1, cm.exception.index)
+            self.assertEqual(6, len(db.query(orm.select(tableSpec), fetchAll=True)))
+
+    def test_column_types(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "typed",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", 'type': 'int', },
+                    'verified': {'definition': "BOOLEAN", 'type': 'bool', 'transform': Ts.boolAsInt, },
+                    'day': {'definition': "DATE", 'type': 'date', },
+                    'at': {'definition': "TIMESTAMP", 'type': 'datetime', },
+                    'doc': {'definition': "JSONB", 'type': 'json', },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            # psycopg converts all of these, only json values need wrapping.
+            self.assertEqual(['doc'], list(orm.compile(tableSpec).TMap.keys()))
+
+            rows = [
+                {'id': 1, 'verified': True, 'day': date(2020, 1, 2), 'at': datetime(2020, 1, 2, 3, 4),
+                 'doc': {'a': [1]}},
+                {'id': 2, 'verified': None, 'day': None, 'at': None, 'doc': [1, 2]},
+            ]
+            orm.insert(tableSpec, rows)
+            self.assertEqual(rows, db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True))
+            orm.update(tableSpec, [{'id': 2, 'doc': {'b': None}}], mode='batch')
+            self.assertEqual([{'doc': {'b': None}}], db.query(
+                'SELECT "doc" FROM "typed" WHERE "id" = 2', fetchAll=True))
+
+            # the stdlib json keeps wide integers, orjson is opt in
+            big = 123456789012345678901234567890
+            orm.update(tableSpec, [{'id': 2, 'doc': {'n': big}}], mode='batch')
+            self.assertEqual([{'doc': {'n': big}}], db.query(
+                'SELECT "doc" FROM "typed" WHERE "id" = 2', fetchAll=True))
+
+            # with orjson non str keys are converted like the stdlib json does
+            fastDB = DB(testpg.url(), fastJSON=True)
+            fastORM = ORM(fastDB)
+            fastORM.update(tableSpec, [{'id': 2, 'doc': {1: 'a'}}], mode='batch')
+            self.assertEqual([{'doc': {'1': 'a'}}], fastDB.query(
+                'SELECT "doc" FROM "typed" WHERE "id" = 2', fetchAll=True))
+            fastDB.close()
+
+    def test_batch_update(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+
+            def rowTransform(row, inverse):
+                res = {**row}
+                if inverse:
+                    res['isInDB'] = True
+                else:
+                    res.pop('isInDB', None)
+                return res
+
+            tableSpec = {
+                'name': "updated",
+                'rowTransform': rowTransform,
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                    'x': {'definition': "DOUBLE PRECISION", },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [
+                {'id': str(i), 'verified': False, 'x': i} for i in range(5)
+            ])
+
+            rows = orm.update(tableSpec, [
+                {'id': '1', 'verified': True, 'isInDB': False},
+                {'id': '9', 'verified': True, 'isInDB': False},
+                {'id': '2', 'x': 20.5, 'isInDB': False},
+                {'id': '1', 'verified': False, 'x': 10, 'isInDB': False},
+                {'id': '3', 'verified': True, 'x': 30, 'isInDB': False},
+            ], mode='batch', batchSize=2, returning=['verified', 'x'])
+            self.assertEqual([
+                {'verified': True, 'x': 1, 'isInDB': True},
+                None,
+                {'verified': False, 'x': 20.5, 'isInDB': True},
+                {'verified': False, 'x': 10, 'isInDB': True},
+                {'verified': True, 'x': 30, 'isInDB': True},
+            ], rows)
+
+            self.assertEqual([None, None], orm.update(tableSpec, [
+                {'id': '4', 'x': 40}, {'id': '9', 'x': 90},
+            ], mode='batch'))
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual([
+                {'id': '0', 'verified': False, 'x': 0, 'isInDB': True},
+                {'id': '1', 'verified': False, 'x': 10, 'isInDB': True},
+                {'id': '2', 'verified': False, 'x': 20.5, 'isInDB': True},
+                {'id': '3', 'verified': True, 'x': 30, 'isInDB': True},
+                {'id': '4', 'verified': False, 'x': 40, 'isInDB': True},
+            ], db.query(qpT, fetchAll=True))
+
+            # returned keys are matched after their transform
+            intSpec = {
+                'name': "updatedInts",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", 'transform': Ts.str, },
+                    'x': {'definition': "INT", },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(intSpec)
+            orm.insert(intSpec, [{'id': 1, 'x': 1}])
+            self.assertEqual([{'x': 2}], orm.update(intSpec, [
+                {'id': 1, 'x': 2},
+            ], mode='batch', returning=['x']))
+
+    def test_keys_delete(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url())
+            orm = ORM(db)
+            tableSpec = {
+                'name': "deleted",
+                'columnSpecs': {
+                    'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                    'n': {'definition': "INT NOT NULL", },
+                    'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                },
+                'primaryKeys': ["id", "n"]
+            }
+            orm.createTable(tableSpec)
+            orm.insert(tableSpec, [
+                {'id': str(i), 'n': i % 2, 'verified': i % 3 == 0} for i in range(10)
+            ])
+
+            rows = orm.delete(tableSpec, [
+                {'id': str(i), 'n': i % 2} for i in range(0, 10, 3)
+            ] + [{'id': '1', 'n': 0}], mode='keys', batchSize=3, fetchAll=True)
+            self.assertEqual([
+                {'id': str(i), 'n': i % 2, 'verified': True} for i in range(0, 10, 3)
+            ], sorted(rows, key=lambda r: r['id']))
+
+            qpT = Pipes().order(orm.select(tableSpec), ['id'])
+            self.assertEqual(['1', '2', '4', '5', '7', '8'],
+                             [row['id'] for row in db.query(qpT, fetchAll=True)])
+
+    def test_prepared(self):
+        with testing.postgresql.Postgresql() as testpg:
+            db = DB(testpg.url(), prepareThreshold=2, preparedMax=3)
+            orm = ORM(db)
+            tableSpec = {
+                'name': "prepared",
+                'columnSpecs': {
+                    'id': {'definition': "INT NOT NULL", },
+                    'a': {'definition': "TEXT", },
+                },
+                'primaryKeys': ["id"]
+            }
+            orm.createTable(tableSpec)
+            for i in range(3):
+                orm.insert(tableSpec, [{'id': i, 'a': '100%'}])
+            for i in range(3):
+                rows = db.query(Pipes().equals(
+                    orm.select(tableSpec), {'id': i}), fetchAll=True)
+                self.assertEqual([{'id': i, 'a': '100%'}], rows)
+
+            counters = list(db.prepared.statements.values())
+            self.assertEqual([3, 3], [c['executions'] for c in counters[-2:]])
+            self.assertEqual(2, db.preparedStats['prepared'])
+            rows = db.query(
+                'SELECT count(*) AS n FROM pg_prepared_statements', fetchAll=True)
+            self.assertEqual(2, rows[0]['n'])
+
+            for i in range(3):
+                db.query('SELECT {} AS n'.format(i), fetchAll=True)
+            self.assertEqual(3, db.preparedStats['statements'])
+            self.assertGreater(db.preparedStats['evictions'], 0)
+
 
 if __name__ == '__main__':
 
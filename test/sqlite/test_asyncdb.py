@@ -1,3 +1,6 @@
+import asyncio
+import gc
+import threading
 import unittest
 from collections import OrderedDict
 
@@ -430,6 +433,126 @@ class TestAsyncDBSQLite(unittest.IsolatedAsyncioTestCase):
             util.quote('t mp._tstrvec3')))
 
 
+    async def test_stream(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "streamed",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        await orm.createTable(tableSpec)
+        await orm.insert(tableSpec, [
+            {'id': i, 'verified': i % 2 == 0} for i in range(5)
+        ])
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        rows = [row async for row in orm.stream(qpT, batchSize=2)]
+        self.assertEqual([
+            {'id': i, 'verified': i % 2 == 0} for i in range(5)
+        ], rows)
+
+        rows = [row async for row in db.stream(qpT, rowMode='tuple')]
+        self.assertEqual([(i, i % 2 == 0) for i in range(5)], rows)
+
+    async def test_executemany_insert(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "many",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        await orm.createTable(tableSpec)
+        rows = await orm.insert(tableSpec, [
+            {'id': i, 'verified': i % 2 == 0} for i in range(5)
+        ], mode='executemany', returning=['id', 'verified'])
+        self.assertEqual([{'id': i, 'verified': i % 2 == 0} for i in range(5)], rows)
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        self.assertEqual(rows, await db.query(qpT))
+        await db.close()
+
+    async def test_streamed_insert(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "streamedin",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        await orm.createTable(tableSpec)
+
+        async def rows(n, verified):
+            for i in range(n):
+                yield {'id': i, 'verified': verified}
+
+        res = await orm.insert(tableSpec, rows(5, False), batchSize=2, returning=['id'])
+        self.assertEqual([{'id': i} for i in range(5)], res)
+        res = await orm.upsert(tableSpec, rows(7, True), batchSize=3,
+                               returning=['id'], mode='onconflict')
+        self.assertEqual([{'id': i} for i in range(7)], res)
+        res = await orm.upsert(tableSpec, rows(2, True), batchSize=3, mode='onconflict')
+        self.assertEqual([], res)
+        res = await orm.upsert(tableSpec, rows(4, True), batchSize=3, returning=['id'])
+        self.assertEqual([{'id': i} for i in range(4)], res)
+        res = await orm.insert(tableSpec, ({'id': i} for i in range(7, 9)), mode='executemany')
+        self.assertEqual([], res)
+
+        rows = await db.query(Pipes().order(orm.select(tableSpec), ['id']))
+        self.assertEqual([{'id': i, 'verified': i < 7} for i in range(9)], rows)
+        await db.close()
+
+    async def test_writer(self):
+        db = DB(':memory:', writeBatchSize=8)
+        await db.query('CREATE TABLE written (id INT NOT NULL, PRIMARY KEY (id))')
+
+        # queued small writes are coalesced, a failing one only fails itself
+        blocker = threading.Event()
+        db._writer.submit(blocker.wait)
+        results = asyncio.gather(*[
+            db.query(('INSERT INTO written (id) VALUES (:id)', {'id': i % 10}))
+            for i in range(11)
+        ], return_exceptions=True)
+        asyncio.get_running_loop().call_soon(blocker.set)
+        results = await results
+        self.assertEqual(1, len([res for res in results if isinstance(res, Exception)]))
+        rows = await db.query('SELECT count(*) AS n FROM written')
+        self.assertEqual([{'n': 10}], rows)
+
+        stats = db.writerStats
+        self.assertEqual(0, stats['queueDepth'])
+        self.assertGreater(stats['maxQueueDepth'], 1)
+        self.assertEqual(11, stats['coalesced'])
+        self.assertLess(stats['batches'], stats['requests'])
+
+        await db.startTransaction()
+        await db.query("INSERT INTO written (id) VALUES (10)")
+        await db.rollback()
+        rows = await db.query('SELECT count(*) AS n FROM written')
+        self.assertEqual([{'n': 10}], rows)
+        await db.close()
+
+        # an unclosed DB stops its writer thread when collected
+        db = DB(':memory:')
+        await db.query('CREATE TABLE unclosed (id INT)')
+        thread = db._writer._thread
+        self.assertTrue(thread.is_alive())
+        del db
+        gc.collect()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
 if __name__ == '__main__':
 
     unittest.main()
@@ -1,10 +1,21 @@
+import math
+import os
+import tempfile
 import unittest
+from array import array
 from collections import OrderedDict
+from datetime import date
+from datetime import datetime
 
+from db.db import Fetcher
 from db.sqlite.db import DB
+from db.sqlite.db import DBError
 from db.sqlite.util import Util
 from db.ts import Ts
+from db.ts import TsError
+from db.ts import np
 from db.sqlite.orm import ORM
+from db.ormqueries import ORMError
 from db.sqlite.pipes import Pipes
 
 
@@ -692,6 +703,693 @@ class TestDBSQLite(unittest.TestCase):
             'TextString': None, 'Float1': None, 'FloatString': None
         }, actRows[3])
 
+    def test_statement_cache(self):
+        db = DB(':memory:', statementCacheSize=2, cursorPoolSize=1)
+        db.query(
+            'CREATE TABLE strvec3 (id TEXT, a REAL, PRIMARY KEY (id))')
+        db.query("INSERT INTO strvec3 (id, a) VALUES ('111', 1)")
+
+        stats0 = db.cacheStats
+        self.assertEqual(2, stats0['statementCacheSize'])
+        self.assertEqual(1, stats0['cursorPoolSize'])
+
+        for _ in range(3):
+            rows = db.query('SELECT * FROM strvec3', fetchAll=True)
+            self.assertEqual([{'id': '111', 'a': 1}], rows)
+
+        stats = db.cacheStats
+        self.assertGreaterEqual(
+            stats['statementHits'] - stats0['statementHits'], 2)
+        self.assertEqual(
+            stats['statementPrepares'] - stats0['statementPrepares'], 1)
+        self.assertEqual(stats['cursorMisses'], stats0['cursorMisses'])
+        self.assertEqual(3, stats['cursorHits'] - stats0['cursorHits'])
+
+        # an unconsumed result keeps its cursor out of the pool
+        gen = db.query('SELECT * FROM strvec3')
+        rows = db.query('SELECT * FROM strvec3', fetchAll=True)
+        self.assertEqual(1, len(rows))
+        self.assertEqual(1, len(list(gen)))
+        self.assertEqual(stats['cursorMisses'] + 1,
+                         db.cacheStats['cursorMisses'])
+
+    def test_wal_readers(self):
+        with self.assertRaises(Exception):
+            DB(':memory:', readers=1)
+
+        with tempfile.TemporaryDirectory() as dirPath:
+            db = DB(os.path.join(dirPath, 'wal.db'), readers=2)
+            self.assertEqual('wal', db.query(
+                'PRAGMA journal_mode', fetchAll=True)[0]['journal_mode'])
+            db.query('CREATE TABLE walvec (id TEXT, a REAL, PRIMARY KEY (id))')
+            db.query("INSERT INTO walvec (id, a) VALUES ('111', 1)")
+
+            self.assertTrue(DB.isReadQuery('SELECT * FROM walvec'))
+            self.assertTrue(DB.isReadQuery(' with t as (select 1) select * from t'))
+            self.assertFalse(DB.isReadQuery(
+                'WITH t AS (SELECT 1) INSERT INTO walvec (id) SELECT * FROM t'))
+            self.assertFalse(DB.isReadQuery("DELETE FROM walvec"))
+
+            # autocommit reads go to the readers, round robin
+            readerMisses = [pool.misses for pool in db._readers]
+            for _ in range(4):
+                rows = db.query('SELECT * FROM walvec', fetchAll=True)
+                self.assertEqual([{'id': '111', 'a': 1}], rows)
+            self.assertEqual([m + 1 for m in readerMisses],
+                             [pool.misses for pool in db._readers])
+            self.assertEqual(2, db.cacheStats['readers'])
+
+            # reads inside a transaction see its uncommitted writes
+            db.startTransaction()
+            db.query("INSERT INTO walvec (id, a) VALUES ('222', 2)")
+            self.assertEqual(2, len(db.query('SELECT * FROM walvec', fetchAll=True)))
+            db.rollback()
+            self.assertEqual(1, len(db.query('SELECT * FROM walvec', fetchAll=True)))
+
+            # temp tables only exist on the writer connection
+            db.query('CREATE TEMP TABLE tmp (id TEXT)')
+            db.query("INSERT INTO tmp (id) VALUES ('333')")
+            self.assertEqual([{'id': '333'}], db.query('SELECT * FROM tmp', fetchAll=True))
+            self.assertEqual([{'id': '333'}], db.query(
+                'SELECT id FROM walvec JOIN "tmp" USING (id) UNION SELECT id FROM temp.tmp',
+                fetchAll=True))
+            db.query('DROP TABLE tmp')
+            self.assertEqual(set(), db._localNames)
+
+            # in memory attaches would differ per connection
+            with self.assertRaises(DBError):
+                db.attach(':memory:', 'm')
+            db.attach(os.path.join(dirPath, 'other.db'), 'o')
+            db.query('CREATE TABLE o.t (a INTEGER)')
+            db.query('INSERT INTO o.t (a) VALUES (1)')
+            self.assertEqual([{'a': 1}], db.query('SELECT * FROM o.t', fetchAll=True))
+
+        # a partially read result keeps its reader on an old snapshot
+        with tempfile.TemporaryDirectory() as dirPath:
+            db = DB(os.path.join(dirPath, 'wal.db'), readers=1, pragmas=['PRAGMA cache_size=-4000'])
+            self.assertEqual([(-4000,)], db._readers[0].connection.cursor().execute(
+                'PRAGMA cache_size').fetchall())
+            db.query('CREATE TABLE walrows (id INT)')
+            db.queryMany('INSERT INTO walrows (id) VALUES (:id)', [{'id': i} for i in range(3000)])
+            rows = db.query('SELECT * FROM walrows')
+            next(rows)
+            db.query('INSERT INTO walrows (id) VALUES (3000)')
+            self.assertEqual([{'n': 3001}], db.query('SELECT count(*) AS n FROM walrows', fetchAll=True))
+            rows.close()
+            self.assertEqual(0, db._readers[0].active)
+            self.assertEqual([{'n': 3001}], db.query('SELECT count(*) AS n FROM walrows', fetchAll=True))
+
+    def test_executemany_insert(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+
+        def rowTransform(row, inverse):
+            res = {**row}
+            if inverse:
+                res['isInDB'] = True
+            else:
+                res.pop('isInDB', None)
+            return res
+
+        tableSpec = {
+            'name': "many",
+            'rowTransform': rowTransform,
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                'x': {'definition': "REAL", },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+
+        stats = db.cacheStats
+        rows = orm.insert(tableSpec, [
+            {'id': str(i), 'verified': i % 2 == 0, 'x': i / 2, 'isInDB': False} for i in range(100)
+        ] + [{'id': 'x', 'verified': True, 'isInDB': False}],
+            mode='executemany', returning=['id', 'verified'], fetchAll=True)
+        self.assertEqual(101, len(rows))
+        self.assertEqual({'id': '2', 'verified': True, 'isInDB': True}, rows[2])
+        # one prepared INSERT per column set, plus SAVEPOINT and RELEASE
+        self.assertEqual(4, db.cacheStats['statementPrepares'] - stats['statementPrepares'])
+
+        # a failing row rolls back the whole insert
+        with self.assertRaises(Exception):
+            orm.insert(tableSpec, [
+                {'id': 'y', 'verified': True}, {'id': '1', 'verified': True},
+            ], mode='executemany')
+        self.assertEqual([{'n': 101}], db.query(
+            'SELECT count(*) AS n FROM many', fetchAll=True))
+
+    def test_onconflict_upsert(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "upserted",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'n': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id", "n"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [{'id': 'a', 'n': 1, 'verified': False}])
+
+        rows = orm.upsert(tableSpec, [
+            {'id': 'a', 'n': 1, 'verified': True},
+            {'id': 'b', 'n': 1, 'verified': False},
+            {'id': 'b', 'n': 1, 'verified': True},
+            {'id': 'c', 'n': 2},
+        ], mode='onconflict', batchSize=2, returning=['id', 'n', 'verified'], fetchAll=True)
+        self.assertEqual([
+            {'id': 'a', 'n': 1, 'verified': True},
+            {'id': 'b', 'n': 1, 'verified': False},
+            {'id': 'b', 'n': 1, 'verified': True},
+            {'id': 'c', 'n': 2, 'verified': False},
+        ], rows)
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        self.assertEqual([
+            {'id': 'a', 'n': 1, 'verified': True},
+            {'id': 'b', 'n': 1, 'verified': True},
+            {'id': 'c', 'n': 2, 'verified': False},
+        ], db.query(qpT, fetchAll=True))
+        self.assertEqual([], orm.upsert(tableSpec, [{'id': 'c', 'n': 3}], mode='onconflict', fetchAll=True))
+
+        with self.assertRaises(ORMError):
+            orm.upsert(tableSpec, [{'id': 'd', 'verified': True}], mode='onconflict')
+
+        # partial rows need the default upsert when NOT NULL columns are missing
+        strictSpec = {
+            'name': "upsertedStrict",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", },
+                'a': {'definition': "INT NOT NULL", },
+                'b': {'definition': "INT", },
+                'c': {'definition': "INT NOT NULL DEFAULT 0", },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(strictSpec)
+        orm.insert(strictSpec, [{'id': 'x', 'a': 1, 'b': 2}])
+        with self.assertRaisesRegex(ORMError, 'NOT NULL columns a'):
+            orm.upsert(strictSpec, [{'id': 'x', 'b': 5}], mode='onconflict')
+        self.assertEqual([{'id': 'x', 'a': 1, 'b': 5, 'c': 0}], orm.upsert(
+            strictSpec, [{'id': 'x', 'b': 5}], returning=['id', 'a', 'b', 'c'], fetchAll=True))
+
+    def test_batch_update(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+
+        def rowTransform(row, inverse):
+            res = {**row}
+            if inverse:
+                res['isInDB'] = True
+            else:
+                res.pop('isInDB', None)
+            return res
+
+        tableSpec = {
+            'name': "updated",
+            'rowTransform': rowTransform,
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                'x': {'definition': "REAL", },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [
+            {'id': str(i), 'verified': False, 'x': i} for i in range(5)
+        ])
+
+        rows = orm.update(tableSpec, [
+            {'id': '1', 'verified': True, 'isInDB': False},
+            {'id': '9', 'verified': True, 'isInDB': False},
+            {'id': '2', 'x': 20.5, 'isInDB': False},
+            {'id': '1', 'verified': False, 'x': 10, 'isInDB': False},
+            {'id': '3', 'verified': True, 'x': 30, 'isInDB': False},
+        ], mode='batch', batchSize=2, returning=['verified', 'x'])
+        self.assertEqual([
+            {'verified': True, 'x': 1, 'isInDB': True},
+            None,
+            {'verified': False, 'x': 20.5, 'isInDB': True},
+            {'verified': False, 'x': 10, 'isInDB': True},
+            {'verified': True, 'x': 30, 'isInDB': True},
+        ], rows)
+
+        self.assertEqual([None, None], orm.update(tableSpec, [
+            {'id': '4', 'x': 40}, {'id': '9', 'x': 90},
+        ], mode='batch'))
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        self.assertEqual([
+            {'id': '0', 'verified': False, 'x': 0, 'isInDB': True},
+            {'id': '1', 'verified': False, 'x': 10, 'isInDB': True},
+            {'id': '2', 'verified': False, 'x': 20.5, 'isInDB': True},
+            {'id': '3', 'verified': True, 'x': 30, 'isInDB': True},
+            {'id': '4', 'verified': False, 'x': 40, 'isInDB': True},
+        ], db.query(qpT, fetchAll=True))
+
+    def test_keys_delete(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "deleted",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'n': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id", "n"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [
+            {'id': str(i), 'n': i % 2, 'verified': i % 3 == 0} for i in range(10)
+        ])
+
+        rows = orm.delete(tableSpec, [
+            {'id': str(i), 'n': i % 2} for i in range(0, 10, 3)
+        ] + [{'id': '1', 'n': 0}], mode='keys', batchSize=3, fetchAll=True)
+        self.assertEqual([
+            {'id': str(i), 'n': i % 2, 'verified': True} for i in range(0, 10, 3)
+        ], sorted(rows, key=lambda r: r['id']))
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        self.assertEqual(['1', '2', '4', '5', '7', '8'],
+                         [row['id'] for row in db.query(qpT, fetchAll=True)])
+
+    def test_compiled_table_spec(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "compiled",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+
+        compiled = orm.compile(tableSpec)
+        self.assertIs(compiled, orm.compile(tableSpec))
+        self.assertEqual('SELECT `id`, `verified` FROM `compiled`', orm.select(tableSpec)[0])
+
+        orm.insert(tableSpec, [{'id': 'a', 'verified': True}, {'id': 'b'}])
+        orm.update(tableSpec, [{'id': 'b', 'verified': True}])
+        self.assertEqual([{'id': 'a', 'verified': True}, {'id': 'b', 'verified': True}],
+                         db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True))
+
+        db.query(('ALTER TABLE "compiled" ADD COLUMN "n" INT', []))
+        tableSpec['columnSpecs']['n'] = {'definition': "INT", }
+        self.assertIsNot(compiled, orm.compile(tableSpec))
+        orm.insert(tableSpec, [{'id': 'c', 'verified': False, 'n': 1}])
+        self.assertEqual([{'id': 'c', 'n': 1, 'verified': False}],
+                         db.query(Pipes().equals(orm.select(tableSpec), map={'id': 'c'}), fetchAll=True))
+
+        # specs are cached by content, in a bounded cache
+        self.assertIs(orm.compile(tableSpec), orm.compile({**tableSpec}))
+        tableSpec['views'] = {'compiledView': {'columnSpecs': {'id': {'transform': Ts.str}}}}
+        self.assertEqual({'id': Ts.str}, orm.compile(tableSpec).viewTMap('compiledView'))
+        tableSpec['views']['compiledView']['columnSpecs']['id']['transform'] = Ts.int
+        self.assertEqual({'id': Ts.int}, orm.compile(tableSpec).viewTMap('compiledView'))
+        for i in range(orm.compiledMax + 1):
+            orm.compile({**tableSpec, 'name': 'compiled{}'.format(i)})
+        self.assertEqual(orm.compiledMax, len(orm._compiled))
+
+    def test_catalog_cache(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpecs = [{
+            'name': name,
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", },
+            },
+            'primaryKeys': ["id"]
+        } for name in ('cataloga', 'catalogb')]
+
+        self.assertEqual([True, True], orm.ensureTables(tableSpecs))
+        self.assertEqual([False, False], orm.ensureTables(tableSpecs))
+        self.assertEqual({'cataloga': {'id'}, 'catalogb': {'id'}},
+                         db.catalogColumns(['cataloga', 'catalogb']))
+
+        # DDL outside the ORM is not seen until the catalog is invalidated.
+        db.query('DROP TABLE "catalogb"')
+        self.assertTrue(orm.tableExists(tableSpecs[1]))
+        db.invalidateCatalog(['catalogb'])
+        self.assertFalse(orm.tableExists(tableSpecs[1]))
+
+        orm.dropTable(tableSpecs[0])
+        self.assertEqual([True, True], orm.ensureTables(tableSpecs))
+
+        db.attach(':memory:', 'other')
+        self.assertIn('other', db.catalogSchemas())
+        self.assertEqual({'other.cataloga': set()}, db.catalogColumns(['other.cataloga']))
+
+    def test_batch_row_transformer(self):
+        T = Ts.RowTransformer({'verified': Ts.boolAsInt})
+        T.chainRowTransform(lambda row, inverse: {**row, 'n': row['n'] + 1})
+        T.chainRowTransform(lambda row, inverse: {**row, 'n': row['n'] * 2})
+        self.assertEqual(2, len(T.rowTransform.rowTransforms))
+
+        rows = [(1, 0), (2, 1)]
+        self.assertEqual([{'n': 4, 'verified': False}, {'n': 6, 'verified': True}],
+                         DB.createRowsT(['n', 'verified'], T)(rows))
+        self.assertEqual([(4, False), (6, True)],
+                         DB.createRowsT(['n', 'verified'], T, rowMode='tuple')(rows))
+        self.assertEqual([(1, False), (2, True)],
+                         DB.createRowsT(['n', 'verified'], {'verified': Ts.boolAsInt}, rowMode='tuple')(rows))
+
+        db = DB(':memory:')
+        db.query('CREATE TABLE "rows" ("n" INT, "verified" INT)')
+        db.query('INSERT INTO "rows" VALUES (1, 0), (2, 1)')
+        self.assertEqual([{'n': 4, 'verified': False}, {'n': 6, 'verified': True}],
+                         list(db.query(('SELECT * FROM "rows" ORDER BY "n"', [], T))))
+
+        # subclasses with their own __call__ transform whole rows
+        class Doubled(Ts.RowTransformer):
+            def __call__(self, row, inverse, *args, **kwargs):
+                return {key: val * 2 for key, val in row.items()}
+
+        self.assertEqual([{'n': 2, 'verified': 0}, {'n': 4, 'verified': 2}],
+                         DB.createRowsT(['n', 'verified'], Doubled({'verified': Ts.boolAsInt}))(rows))
+
+        # the first row does not wait for a whole batch
+        source = iter(range(5000))
+
+        def fetchOne():
+            n = next(source, None)
+            return None if n is None else (n,)
+
+        rows = DB.generateRows(Fetcher(['n'], fetchOne), lambda rows: rows)
+        self.assertEqual((0,), next(rows))
+        self.assertEqual(1, next(source))
+        self.assertEqual(list(range(2, 5000)), [row[0] for row in rows])
+
+    def test_fast_json(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "documents",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'doc': {'definition': "TEXT", 'transform': Ts.nullableFastJSON, },
+                'docs': {'definition': "TEXT", 'transform': Ts.fastListTCreator(Ts.fastJSON), },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        rows = [
+            {'id': 0, 'doc': {'a': [1, 2.5, None, True]}, 'docs': [{'b': 'c'}]},
+            {'id': 1, 'doc': None, 'docs': []},
+            {'id': 2, 'doc': {'s': {1, 2}}, 'docs': [{1, 2}]},
+        ]
+        orm.insert(tableSpec, rows)
+        self.assertEqual(rows, db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True))
+
+        self.assertEqual('{"a":[1,2]}', Ts.fastJSON({'a': [1, 2]}))
+        # Values written by the jsonpickle transforms read back unchanged.
+        self.assertEqual({'s': {1}, 't': (1, 2)}, Ts.fastJSON(Ts.json({'s': {1}, 't': (1, 2)}), True))
+
+        # Non finite floats survive with or without orjson.
+        doc = Ts.fastJSON(Ts.fastJSON({'a': [float('inf'), None], 'b': float('-inf')}), True)
+        self.assertEqual({'a': [float('inf'), None], 'b': float('-inf')}, doc)
+        self.assertTrue(math.isnan(Ts.fastJSON(Ts.fastJSON(float('nan')), True)))
+        self.assertTrue(math.isnan(Ts.fastListTCreator(Ts.fastJSON)(
+            Ts.fastListTCreator(Ts.fastJSON)([float('nan')]), True)[0]))
+
+    def test_column_types(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "typed",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", 'type': 'int', },
+                'verified': {'definition': "INT", 'type': 'bool', },
+                'day': {'definition': "TEXT", 'type': 'date', },
+                'at': {'definition': "TEXT", 'type': 'datetime', },
+                'doc': {'definition': "TEXT", 'type': 'json', },
+                'name': {'definition': "TEXT", 'type': 'str', 'transform': Ts.str, },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        # SQLite has no converters for these, they fall back to Ts.
+        self.assertEqual(['at', 'day', 'doc', 'verified'], sorted(orm.compile(tableSpec).TMap.keys()))
+
+        rows = [
+            {'id': 1, 'verified': True, 'day': date(2020, 1, 2), 'at': datetime(2020, 1, 2, 3, 4),
+             'doc': {'a': [1]}, 'name': 'a'},
+            {'id': 2, 'verified': None, 'day': None, 'at': None, 'doc': None, 'name': None},
+        ]
+        orm.insert(tableSpec, rows)
+        self.assertEqual(rows, db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True))
+        self.assertEqual([(1, '2020-01-02')], list(db.query(
+            'SELECT "id", "day" FROM "typed" WHERE "verified" = 1', rowMode='tuple')))
+
+    @unittest.skipIf(isinstance(np, str), 'numpy is not installed')
+    def test_ndarray_buffer(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "arrays",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'values': {'definition': "BLOB", 'transform': Ts.npArrayAsBuffer, },
+                'typed': {'definition': "BLOB", 'type': 'ndarray', },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        values = np.arange(12, dtype='>i4').reshape(3, 4).T
+        orm.insert(tableSpec, [
+            {'id': 1, 'values': values, 'typed': np.float32(1.5)},
+            {'id': 2, 'values': np.zeros((0, 2)), 'typed': None},
+        ])
+        rows = db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True)
+        self.assertEqual(values.dtype, rows[0]['values'].dtype)
+        self.assertTrue(np.array_equal(values, rows[0]['values']))
+        self.assertFalse(rows[0]['values'].flags.owndata)
+        self.assertEqual(0, (len(Ts.npArrayAsBuffer(values)) - values.nbytes) % 16)
+        self.assertTrue(rows[0]['values'].flags.aligned)
+        self.assertEqual(np.float32(1.5), rows[0]['typed'])
+        self.assertEqual((0, 2), rows[1]['values'].shape)
+        self.assertIsNone(rows[1]['typed'])
+        with self.assertRaises(TsError):
+            Ts.npArrayAsBuffer(np.zeros(2, dtype=[('x', '<i4'), ('y', '<f8')]))
+        with self.assertRaises(TsError):
+            Ts.npArrayAsBuffer(np.array([None, 1]))
+
+    def test_stable_params(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        orm.util.stableParams = True
+        pipes = Pipes()
+        pipes.util.stableParams = True
+        tableSpec = {
+            'name': "stable",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'a': {'definition': "INT", },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+
+        qs = [
+            pipes.equals(orm.select(tableSpec), {'id': i, 'a': i})[0] for i in range(2)
+        ]
+        self.assertEqual(qs[0], qs[1])
+        self.assertNotEqual(
+            Pipes().equals(orm.select(tableSpec), {'id': 0})[0],
+            Pipes().equals(orm.select(tableSpec), {'id': 0})[0])
+
+        q, p, _ = pipes.limit(pipes.equals(
+            orm.select(tableSpec), {'id': 0}), 1, 1)
+        self.assertEqual(3, len(p))
+
+        qs = [
+            pipes.equals(orm.select(tableSpec), [{'id': i}, {'id': i + 1}])[0] for i in range(2)
+        ]
+        self.assertEqual(qs[0], qs[1])
+        qs = [
+            orm._deleteSelectQuery(tableSpec, [{'id': i}, {'id': i + 1}])[0][0][0] for i in range(2)
+        ]
+        self.assertEqual(qs[0], qs[1])
+        # nested anys do not reuse the outer names
+        q, p, _ = pipes.any(orm.select(tableSpec), [
+            [pipes.equals, {'map': [{'id': 0}, {'id': 1}]}],
+            [pipes.equals, {'map': {'a': 0}}],
+        ])
+        self.assertEqual([], db.query((q, p), fetchAll=True))
+
+        stats = db.cacheStats
+        for i in range(3):
+            orm.insert(tableSpec, [{'id': 2 * i, 'a': i}, {'id': 2 * i + 1, 'a': i}])
+        self.assertEqual(1, db.cacheStats['statementPrepares'] - stats['statementPrepares'])
+        self.assertEqual(6, len(db.query(orm.select(tableSpec), fetchAll=True)))
+
+        orm.delete(tableSpec, [{'id': 0}, {'id': 1}])
+        orm.delete(tableSpec, [{'id': 2}, {'id': 3}])
+        self.assertEqual(2, len(db.query(orm.select(tableSpec), fetchAll=True)))
+
+    def test_streamed_insert(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "streamedin",
+            'columnSpecs': {
+                'id': {'definition': "INT NOT NULL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+
+        consumed = []
+
+        def rows(n, verified):
+            for i in range(n):
+                consumed.append(i)
+                yield {'id': i, 'verified': verified}
+
+        res = orm.insert(tableSpec, rows(7, False), batchSize=3,
+                         returning=['id'], fetchAll=True)
+        self.assertEqual([{'id': i} for i in range(7)], res)
+        self.assertEqual(list(range(7)), consumed)
+
+        res = orm.insert(tableSpec, ({'id': i} for i in range(7, 10)),
+                         batchSize=2, mode='executemany')
+        self.assertEqual([], list(res))
+
+        res = orm.upsert(tableSpec, rows(12, True), batchSize=5,
+                         returning=['id'], mode='onconflict', fetchAll=True)
+        self.assertEqual(12, len(res))
+        res = orm.upsert(tableSpec, iter([{'id': 0, 'verified': False}]),
+                         returning=['id', 'verified'], fetchAll=True)
+        self.assertEqual([{'id': 0, 'verified': False}], res)
+
+        rows = db.query(Pipes().order(orm.select(tableSpec), ['id']), fetchAll=True)
+        self.assertEqual([{'id': 0, 'verified': False}] + [
+            {'id': i, 'verified': True} for i in range(1, 12)
+        ], rows)
+
+    def test_row_modes(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "modes",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+                'x y': {'definition': "REAL", },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [
+            {'id': '111', 'verified': True, 'x y': 1.5},
+        ])
+
+        rows = db.query(orm.select(tableSpec), fetchAll=True)
+        self.assertEqual([{'id': '111', 'verified': True, 'x y': 1.5}], rows)
+
+        rows = db.query(orm.select(tableSpec), fetchAll=True, rowMode='tuple')
+        self.assertEqual([('111', True, 1.5)], rows)
+
+        rows = db.query(orm.select(tableSpec),
+                        fetchAll=True, rowMode='namedtuple')
+        self.assertEqual('111', rows[0].id)
+        self.assertEqual(('111', True, 1.5), tuple(rows[0]))
+
+        rows = db.query(orm.select(tableSpec, rowMode='slots'), fetchAll=True)
+        self.assertEqual('111', rows[0].id)
+        self.assertEqual(True, rows[0]['verified'])
+        self.assertEqual(1.5, rows[0]['x y'])
+        self.assertEqual(('id', 'verified', 'x y'), rows[0].keys())
+        self.assertEqual({'id': '111', 'verified': True, 'x y': 1.5}, rows[0])
+        self.assertFalse(hasattr(rows[0], '__dict__'))
+
+        # columns named like Record methods do not hide them
+        row = db.query('SELECT 1 AS "keys", 2 AS "get"', fetchAll=True, rowMode='slots')[0]
+        self.assertEqual({'keys': 1, 'get': 2}, row)
+        self.assertEqual(('keys', 'get'), row.keys())
+        self.assertEqual(2, row.get('get'))
+        self.assertEqual("Record(keys=1, get=2)", repr(row))
+
+        tableSpec['rowTransform'] = lambda row, inverse: {
+            **row, 'isInDB': True} if inverse else row
+        rows = db.query(orm.select(tableSpec, rowMode='tuple'), fetchAll=True)
+        self.assertEqual([('111', True, 1.5, True)], rows)
+
+    def test_lazy_rows(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        calls = []
+
+        def counted(val, inverse=False):
+            if inverse:
+                calls.append(val)
+            return Ts.fastJSON(val, inverse)
+
+        tableSpec = {
+            'name': "lazy",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", },
+                'a': {'definition': "TEXT", 'transform': counted, },
+                'b': {'definition': "TEXT", 'transform': counted, },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [{'id': '1', 'a': {'n': 1}, 'b': [1, 2]}])
+
+        rows = db.query(orm.select(tableSpec, rowMode='lazy'), fetchAll=True)
+        self.assertEqual([], calls)
+        self.assertEqual({'n': 1}, rows[0]['a'])
+        self.assertIs(rows[0]['a'], rows[0]['a'])
+        self.assertEqual(1, len(calls))
+        self.assertEqual('1', rows[0]['id'])
+        self.assertTrue('b' in rows[0])
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['a', 'b', 'id'], list(rows[0].keys()))
+        self.assertEqual({'id': '1', 'a': {'n': 1}, 'b': [1, 2]}, rows[0])
+        self.assertEqual(2, len(calls))
+
+    def test_query_columnar(self):
+        db = DB(':memory:')
+        orm = ORM(db)
+        tableSpec = {
+            'name': "columnar",
+            'columnSpecs': {
+                'id': {'definition': "TEXT NOT NULL", 'transform': Ts.str, },
+                'n': {'definition': "INT", },
+                'x': {'definition': "REAL", },
+                'verified': {'definition': "INT", 'transform': Ts.boolAsInt, },
+            },
+            'primaryKeys': ["id"]
+        }
+        orm.createTable(tableSpec)
+        orm.insert(tableSpec, [
+            {'id': '111', 'n': 1, 'x': 1.5, 'verified': True},
+            {'id': '222', 'n': 2, 'x': 2, 'verified': False},
+        ])
+
+        qpT = Pipes().order(orm.select(tableSpec), ['id'])
+        columns = db.queryColumnar(qpT)
+        self.assertEqual(['id', 'n', 'verified', 'x'], sorted(columns.keys()))
+        self.assertEqual(['111', '222'], columns['id'])
+        self.assertEqual([True, False], columns['verified'])
+        self.assertEqual(array('q', [1, 2]), columns['n'])
+        self.assertEqual(array('d', [1.5, 2.0]), columns['x'])
+
+        columns = db.queryColumnar('SELECT * FROM columnar WHERE 0')
+        self.assertEqual({'id': [], 'n': [], 'verified': [], 'x': []}, columns)
+        self.assertEqual([], db.query('SELECT * FROM columnar WHERE 0', fetchAll=True))
+
 
 if __name__ == '__main__':
 